@@ -106,6 +106,21 @@ CHANNEL_LAYERS = {
 #     },
 # }
 
+# Shared cache, so rollup report generations and cached reports agree across
+# web and worker processes. LocMem is per process and only fit for local runs.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+            "KEY_PREFIX": "timesheet",
+        },
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -165,8 +180,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'timesheet_app.authentication.CookieJWTAuthentication',
+        'timesheet_app.authentication.HeaderOrCookieJWTAuthentication',
     ],
 }
 SIMPLE_JWT = {
@@ -178,10 +192,36 @@ SIMPLE_JWT = {
     'TOKEN_BLACKLIST_ENABLED': True,
 }
 
+# Access tokens remembered after their first successful validation
+JWT_VALIDATION_CACHE_SIZE = int(os.getenv("JWT_VALIDATION_CACHE_SIZE", 10000))
+
 SESSION_COOKIE_SAMESITE = "Lax"
 SESSION_COOKIE_SECURE =False
 
 CSRF_COOKIE_SAMESITE = "Lax"
 CSRF_COOKIE_SECURE =False
 
-AUTH_USER_MODEL = 'timesheet_app.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'timesheet_app.CustomUser'
+
+# Notification retention in days, enforced by `manage.py purge_notifications`
+NOTIFICATION_RETENTION_READ_DAYS = int(os.getenv("NOTIFICATION_RETENTION_READ_DAYS", 90))
+NOTIFICATION_RETENTION_UNREAD_DAYS = int(os.getenv("NOTIFICATION_RETENTION_UNREAD_DAYS", 365))
+
+# WebSocket presence registry. The in-memory backend only works when the
+# process sending pushes is the one holding the sockets (tests, runserver).
+PRESENCE_BACKEND = os.getenv(
+    "PRESENCE_BACKEND",
+    "timesheet_app.presence.RedisPresence" if os.getenv("REDIS_URL") else "timesheet_app.presence.InMemoryPresence",
+)
+PRESENCE_TTL_SECONDS = int(os.getenv("PRESENCE_TTL_SECONDS", 90))
+
+# Notification socket heartbeat: presence is renewed every N seconds. Sockets
+# opened with ?heartbeat=1 are also pinged and closed after MISSES silent
+# beats. Keep the interval below PRESENCE_TTL_SECONDS.
+NOTIFICATION_HEARTBEAT_SECONDS = int(os.getenv("NOTIFICATION_HEARTBEAT_SECONDS", 25))
+NOTIFICATION_HEARTBEAT_MISSES = int(os.getenv("NOTIFICATION_HEARTBEAT_MISSES", 3))
+
+# WebSocket handshake auth: how long a resolved user is reused, and how many
+# handshakes may hit the database at once on a cold cache
+WS_AUTH_USER_CACHE_SECONDS = int(os.getenv("WS_AUTH_USER_CACHE_SECONDS", 60))
+WS_AUTH_MAX_CONCURRENT_LOOKUPS = int(os.getenv("WS_AUTH_MAX_CONCURRENT_LOOKUPS", 8))
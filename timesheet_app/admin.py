@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser, Admin, TeamLeader, User, Team, Project, Task, Timesheet ,Department,TimesheetReview,Notification
+from .models import CustomUser, Admin, TeamLeader, User, Team, Project, Task, Timesheet ,Department,TimesheetReview,Notification,TimesheetDailyRollup,OutboxMessage
 
 admin.site.register(CustomUser)
 admin.site.register(Admin)
@@ -12,4 +12,6 @@ admin.site.register(Department)
 admin.site.register(Timesheet)
 admin.site.register(TimesheetReview)
 admin.site.register(Notification)
+admin.site.register(TimesheetDailyRollup)
+admin.site.register(OutboxMessage)
 
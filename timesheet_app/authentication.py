@@ -1,7 +1,109 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework.exceptions import AuthenticationFailed
+from timesheet_app.models import ClaimsUser
 
-class CookieJWTAuthentication(JWTAuthentication):
+
+def add_user_claims(token, user):
+    # Lets ClaimsJWTAuthentication build request.user without a query. Inactive
+    # users get no claims, so their tokens go through simplejwt's get_user and
+    # are rejected there.
+    if not user.is_active:
+        return token
+    for claim in ClaimsUser.TOKEN_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class ValidatedTokenCache:
+    # Bounded LRU of access tokens that already passed signature and claim
+    # checks, keyed by a hash of the raw token. Entries die at the token's exp.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, raw_token):
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        return hashlib.sha256(raw_token).digest()
+
+    def get(self, raw_token):
+        key = self.key(raw_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, validated_token = entry
+            if expires_at <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return validated_token
+
+    def set(self, raw_token, validated_token):
+        key = self.key(raw_token)
+        with self.lock:
+            self.entries[key] = (validated_token["exp"], validated_token)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+validated_tokens = ValidatedTokenCache(settings.JWT_VALIDATION_CACHE_SIZE)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        validated_token = validated_tokens.get(raw_token)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            validated_tokens.set(raw_token, validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        # Tokens issued before the claims were added still get the DB lookup
+        if not all(claim in validated_token for claim in ClaimsUser.TOKEN_CLAIMS):
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed("Token contained no recognizable user identification")
+        return ClaimsUser.from_claims(user_id, validated_token)
+
+
+class HeaderOrCookieJWTAuthentication(ClaimsJWTAuthentication):
+    # One pass over both places a token can come from: a bad Authorization
+    # header is rejected, a bad cookie is ignored (anonymous), as before
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is not None:
+            raw_token = self.get_raw_token(header)
+            if raw_token is not None:
+                validated_token = self.get_validated_token(raw_token)
+                return self.get_user(validated_token), validated_token
+
+        raw_token = request.COOKIES.get("access_token")
+        if not raw_token:
+            return None
+        try:
+            validated_token = self.get_validated_token(raw_token)
+            return self.get_user(validated_token), validated_token
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+
+class CookieJWTAuthentication(ClaimsJWTAuthentication):
     def authenticate(self, request):
         access_token = request.COOKIES.get("access_token")
         if not access_token:
@@ -1,5 +1,49 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from urllib.parse import parse_qs
+import asyncio
 import json
+import logging
+from timesheet_app.models import Notification
+from timesheet_app.presence import get_presence
+from timesheet_app.serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+# Larger gaps are better served by the paginated NotificationListView
+CATCH_UP_LIMIT = 100
+
+# Upper bounds for the coalescing window a client may ask for
+MAX_BATCH_MS = 250
+MAX_BATCH_SIZE = 100
+
+# Process-wide counters for coalesced delivery
+coalesce_stats = {"events": 0, "frames": 0, "frames_saved": 0}
+
+# Process-wide gauge: sockets open now, and totals closed by the client or reaped
+connection_stats = {"live": 0, "closed": 0, "reaped": 0}
+
+
+def parse_query(scope):
+    return parse_qs(scope.get("query_string", b"").decode())
+
+def clamp_int(query, name, upper):
+    try:
+        return max(0, min(int(query[name][0]), upper))
+    except (KeyError, ValueError):
+        return 0
+
+
+@database_sync_to_async
+def fetch_missed_notifications(user_id, since_id):
+    # Ids follow creation order, so (user_id, id > since) is a range on the user_id index
+    missed = list(
+        Notification.objects.filter(user_id=user_id, id__gt=since_id).order_by('id')[:CATCH_UP_LIMIT + 1]
+    )
+    return NotificationSerializer(missed[:CATCH_UP_LIMIT], many=True).data, len(missed) > CATCH_UP_LIMIT
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -8,17 +52,177 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         if user and user.is_authenticated and str(user.id) == user_id_from_path:
             self.user_id = str(user.id)
             self.group_name = f"user_{self.user_id}"
+            self.replayed_through = 0
+            self.configure_batching()
+            # Opt-in with ?heartbeat=1: only these sockets get ping frames and
+            # can be reaped, older clients keep the plain notification stream
+            self.heartbeat_enabled = parse_query(self.scope).get("heartbeat") == ["1"]
+            # Join first so nothing created during the catch-up query is missed
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            # Team and project groups are joined by send_notifications right
+            # before a push; the groups seen here are left on disconnect
+            self.broadcast_groups = set()
             await self.accept()
+            self.last_seen = asyncio.get_running_loop().time()
+            self.left = False
+            connection_stats["live"] += 1
+            await self.mark_present()
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+            if self.batch_ms:
+                await self.send(text_data=json.dumps({
+                    "event": "batching", "batch_ms": self.batch_ms, "batch_max": self.batch_max,
+                }))
+            if self.heartbeat_enabled:
+                await self.send(text_data=json.dumps({
+                    "event": "heartbeat", "interval": settings.NOTIFICATION_HEARTBEAT_SECONDS,
+                }))
+            await self.catch_up()
         else:
             await self.close()
 
+    async def mark_present(self):
+        # Presence only lets pushes skip offline users; an outage must not
+        # fail the socket (pushes fail open meanwhile)
+        try:
+            await sync_to_async(get_presence().touch, thread_sensitive=False)(self.user_id, self.channel_name)
+        except Exception as e:
+            logger.warning("Presence update failed for user %s: %s", self.user_id, e)
+
+    async def heartbeat(self):
+        # Renews the presence entry every NOTIFICATION_HEARTBEAT_SECONDS. Opted-in
+        # sockets are also pinged, and any inbound frame counts as a reply; those
+        # silent for NOTIFICATION_HEARTBEAT_MISSES beats are half-open and reaped.
+        interval = settings.NOTIFICATION_HEARTBEAT_SECONDS
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if self.heartbeat_enabled:
+                if loop.time() - self.last_seen > interval * settings.NOTIFICATION_HEARTBEAT_MISSES:
+                    await self.reap()
+                    return
+                await self.send(text_data=json.dumps({"event": "ping"}))
+            await self.mark_present()
+
+    async def reap(self):
+        # Leave every group now rather than waiting for a disconnect the dead
+        # peer may never complete
+        connection_stats["reaped"] += 1
+        await self.leave()
+        logger.info(
+            "Reaped idle socket for user %s (live=%d reaped=%d)",
+            self.user_id, connection_stats["live"], connection_stats["reaped"],
+        )
+        await self.close(code=4408)
+
+    def configure_batching(self):
+        # Opt-in with ?batch_ms=50&batch_max=20: notifications arriving within
+        # the window go out together as one JSON array frame
+        query = parse_query(self.scope)
+        self.batch_ms = clamp_int(query, "batch_ms", MAX_BATCH_MS)
+        self.batch_max = clamp_int(query, "batch_max", MAX_BATCH_SIZE) or MAX_BATCH_SIZE
+        self.pending = []
+        self.flush_handle = None
+        self.frames_saved = 0
+
+    async def catch_up(self):
+        # ?since=<last notification id the client has seen>
+        query = parse_query(self.scope)
+        try:
+            since_id = int(query["since"][0])
+        except (KeyError, ValueError):
+            return
+
+        notifications, truncated = await fetch_missed_notifications(self.user_id, since_id)
+        if notifications:
+            self.replayed_through = notifications[-1]["id"]
+        await self.send(text_data=json.dumps({
+            "event": "catch_up",
+            "notifications": notifications,
+            "truncated": truncated,
+        }, default=str))
+
     async def disconnect(self, close_code):
-        if hasattr(self, "group_name"):
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        # Anything still pending is stored and comes back through catch-up
+        if getattr(self, "flush_handle", None):
+            self.flush_handle.cancel()
+        if hasattr(self, "heartbeat_task"):
+            if self.heartbeat_task is not asyncio.current_task():
+                self.heartbeat_task.cancel()
+            if not self.left:
+                connection_stats["closed"] += 1
+            await self.leave()
+
+    async def leave(self):
+        if self.left:
+            return
+        self.left = True
+        connection_stats["live"] -= 1
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        # A join whose push never arrived expires with the layer's group_expiry
+        for group in self.broadcast_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        # Last, so a presence outage can't keep the socket in its groups; a
+        # missed removal just expires after PRESENCE_TTL_SECONDS
+        try:
+            await sync_to_async(get_presence().remove, thread_sensitive=False)(self.user_id, self.channel_name)
+        except Exception as e:
+            logger.warning("Presence removal failed for user %s: %s", self.user_id, e)
 
     async def receive(self, text_data):
+        self.last_seen = asyncio.get_running_loop().time()
+        try:
+            frame_type = json.loads(text_data).get("type")
+        except (TypeError, ValueError, AttributeError):
+            frame_type = None
+        if frame_type == "pong":
+            return
+        if frame_type == "ping":
+            await self.send(text_data=json.dumps({"event": "pong"}))
+            return
         await self.send(text_data=json.dumps({"ack": "Message received"}))
 
     async def send_notification(self, event):
-        await self.send(text_data=json.dumps(event["notification"]))
+        # Already delivered in the catch-up frame
+        if event["notification"].get("id", 0) <= self.replayed_through:
+            return
+        if not self.batch_ms:
+            await self.send(text_data=json.dumps(event["notification"]))
+            return
+
+        self.pending.append(event["notification"])
+        if len(self.pending) >= self.batch_max:
+            await self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                self.batch_ms / 1000, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def send_group_notification(self, event):
+        # One event per team/project carrying the shared message; this socket
+        # only shows it if its user is a recipient, under that user's row id.
+        # created_at is the first recipient's; rows come from one bulk insert.
+        self.broadcast_groups.add(event["group"])
+        notification_id = event["recipients"].get(self.user_id)
+        if notification_id:
+            await self.send_notification({"notification": {
+                **event["notification"], "id": notification_id, "user": int(self.user_id),
+            }})
+
+    async def flush(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        await self.send(text_data=json.dumps(batch))
+        self.frames_saved += len(batch) - 1
+        coalesce_stats["events"] += len(batch)
+        coalesce_stats["frames"] += 1
+        coalesce_stats["frames_saved"] += len(batch) - 1
+
+    async def notifications_read(self, event):
+        # Keep read-state after the notifications it refers to
+        if self.batch_ms:
+            await self.flush()
+        await self.send(text_data=json.dumps({"event": "notifications_read", **event["payload"]}))
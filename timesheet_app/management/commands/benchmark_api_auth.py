@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+from timesheet_app import authentication
+from timesheet_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Measure per-request authentication overhead for cookie-authenticated API calls."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("Needs at least one user in the database.")
+        token = str(authentication.add_user_claims(RefreshToken.for_user(user).access_token, user))
+        factory = RequestFactory()
+        factory.cookies["access_token"] = token
+        count = options["requests"]
+
+        # Previous setup: header authenticator, then cookie authenticator, full validation each time
+        header_auth, cookie_auth = JWTAuthentication(), authentication.CookieJWTAuthentication()
+        def two_pass(request):
+            authentication.validated_tokens.clear()
+            return header_auth.authenticate(request) or cookie_auth.authenticate(request)
+
+        combined = authentication.HeaderOrCookieJWTAuthentication()
+        authentication.validated_tokens.clear()
+
+        for label, authenticate in (("two authenticators, uncached", two_pass), ("combined, cached", combined.authenticate)):
+            requests = [Request(factory.get("/api/notifications/unread-count/")) for _ in range(count)]
+            started = time.perf_counter()
+            for request in requests:
+                if authenticate(request) is None:
+                    raise CommandError("Request was not authenticated.")
+            per_request = (time.perf_counter() - started) / count * 1e6
+            self.stdout.write(f"{label}: {per_request:.1f} µs per request over {count} requests")
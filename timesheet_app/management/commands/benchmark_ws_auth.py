@@ -0,0 +1,51 @@
+import asyncio
+import time
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+from timesheet_app import middleware_ws
+from timesheet_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Simulate a WebSocket reconnect storm through JWTAuthMiddleware and report handshake latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=500, help="Concurrent handshakes per round.")
+        parser.add_argument("--users", type=int, default=50, help="Distinct existing users to spread them over.")
+
+    def handle(self, *args, **options):
+        users = list(CustomUser.objects.order_by("id")[:options["users"]])
+        if not users:
+            raise CommandError("Needs at least one user in the database.")
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        handshakes = [tokens[i % len(tokens)] for i in range(options["connections"])]
+
+        middleware_ws.user_cache.clear()
+        self.report("cold cache", async_to_sync(self.storm)(handshakes))
+        self.report("warm cache", async_to_sync(self.storm)(handshakes))
+
+    async def storm(self, handshakes):
+        async def app(scope, receive, send):
+            if not scope["user"].is_authenticated:
+                raise CommandError("Handshake was not authenticated.")
+
+        middleware = middleware_ws.JWTAuthMiddleware(app)
+
+        async def handshake(token):
+            started = time.perf_counter()
+            await middleware({"type": "websocket", "query_string": f"token={token}".encode()}, None, None)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(handshake(token) for token in handshakes))
+        return sorted(latencies), time.perf_counter() - started
+
+    def report(self, label, result):
+        latencies, elapsed = result
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        self.stdout.write(
+            f"{label}: {len(latencies)} handshakes in {elapsed * 1000:.1f} ms, "
+            f"p50 {pct(0.5):.2f} ms, p99 {pct(0.99):.2f} ms, max {latencies[-1] * 1000:.2f} ms"
+        )
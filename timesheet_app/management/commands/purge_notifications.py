@@ -0,0 +1,77 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from timesheet_app.models import Notification
+
+# Rough per-row cost on top of the message text (ids, flags, timestamp, index entries)
+ROW_OVERHEAD_BYTES = 64
+
+
+class Command(BaseCommand):
+    help = "Delete notifications older than the retention policy, in small id-range chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--read-days", type=int, default=settings.NOTIFICATION_RETENTION_READ_DAYS)
+        parser.add_argument("--unread-days", type=int, default=settings.NOTIFICATION_RETENTION_UNREAD_DAYS)
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="Width of each id range; each range is its own short transaction.")
+        parser.add_argument("--sleep", type=float, default=0.05,
+                            help="Seconds to pause between chunks so writers can get the lock.")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = (
+            Q(is_read=True, created_at__lt=now - timedelta(days=options["read_days"])) |
+            Q(is_read=False, created_at__lt=now - timedelta(days=options["unread_days"]))
+        )
+        bounds = Notification.objects.filter(expired).aggregate(low=Min("id"), high=Max("id"))
+        if bounds["low"] is None:
+            self.stdout.write("No notifications past retention.")
+            return
+
+        freed_pages_before = self.sqlite_free_pages()
+        rows = payload_bytes = 0
+        chunk_size = options["chunk_size"]
+
+        for start in range(bounds["low"], bounds["high"] + 1, chunk_size):
+            chunk = Notification.objects.filter(expired, id__gte=start, id__lt=start + chunk_size)
+            with transaction.atomic():
+                stats = chunk.aggregate(count=Count("id"), size=Sum(Length("message")))
+                if not stats["count"]:
+                    continue
+                if not options["dry_run"]:
+                    unread = chunk.filter(is_read=False).values("user_id").annotate(count=Count("id")).order_by()
+                    Notification.adjust_unread_counts({row["user_id"]: -row["count"] for row in unread})
+                    chunk.delete()
+            rows += stats["count"]
+            payload_bytes += (stats["size"] or 0) + stats["count"] * ROW_OVERHEAD_BYTES
+            if not options["dry_run"] and options["sleep"]:
+                time.sleep(options["sleep"])
+
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {rows} notifications, about {payload_bytes / 1024:.1f} KiB of row data."
+        ))
+        freed_pages_after = self.sqlite_free_pages()
+        if not options["dry_run"] and freed_pages_before is not None:
+            page_size = self.sqlite_pragma("page_size")
+            freed = (freed_pages_after - freed_pages_before) * page_size
+            self.stdout.write(
+                f"SQLite free pages grew by {freed / 1024:.1f} KiB; run VACUUM to return them to the OS."
+            )
+
+    def sqlite_pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def sqlite_free_pages(self):
+        if connection.vendor != "sqlite":
+            return None
+        return self.sqlite_pragma("freelist_count")
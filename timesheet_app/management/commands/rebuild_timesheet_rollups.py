@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from timesheet_app.models import Timesheet, TimesheetDailyRollup
+from timesheet_app.utils import bump_rollup_generations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the TimesheetDailyRollup table from the raw timesheets."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            months = set(TimesheetDailyRollup.objects.dates("date", "month"))
+            deleted, _ = TimesheetDailyRollup.objects.all().delete()
+            rollups = TimesheetDailyRollup.aggregate_timesheets(Timesheet.objects.all())
+            TimesheetDailyRollup.objects.bulk_create(rollups, batch_size=options["batch_size"])
+            # Cached reports for every month before or after the rebuild go stale
+            months.update(TimesheetDailyRollup.objects.dates("date", "month"))
+            transaction.on_commit(lambda: bump_rollup_generations(months))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt timesheet rollups: removed {deleted}, created {len(rollups)}."
+        ))
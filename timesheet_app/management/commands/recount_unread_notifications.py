@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from timesheet_app.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's unread notification counter from the Notification table."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = list(
+                CustomUser.objects.annotate(
+                    actual=Count('notifications', filter=Q(notifications__is_read=False))
+                ).only('id', 'unread_notification_count')
+            )
+            drifted = [user for user in users if user.unread_notification_count != user.actual]
+            for user in drifted:
+                user.unread_notification_count = user.actual
+            CustomUser.objects.bulk_update(drifted, ['unread_notification_count'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(f"Corrected {len(drifted)} of {len(users)} unread counters."))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from timesheet_app.outbox import MAX_ATTEMPTS, process_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued Telegram and WebSocket notifications from the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+        parser.add_argument("--once", action="store_true",
+                            help="Drain what is currently due and exit.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Outbox worker started.")
+        try:
+            while True:
+                close_old_connections()
+                processed = process_batch(options["batch_size"], options["max_attempts"])
+                if processed:
+                    self.stdout.write(f"Processed {processed} outbox messages.")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Outbox worker stopped.")
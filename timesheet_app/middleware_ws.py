@@ -1,23 +1,116 @@
+import asyncio
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qs
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
-from jwt import decode as jwt_decode 
+from timesheet_app.models import ClaimsUser
 
 User = get_user_model()
 
+# All NotificationConsumer needs from the user
+SOCKET_USER_FIELDS = ("id", "username", "usertype", "team")
+
+
+class SocketUser:
+    # Lightweight stand-in for CustomUser on the WebSocket scope
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, username, usertype, team):
+        self.id = self.pk = id
+        self.username = username
+        self.usertype = usertype
+        self.team = team
+
+
+class SocketUserCache:
+    # Short-lived, size-bounded map of user id -> SocketUser. Only touched
+    # from the event loop, so it needs no lock.
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return user
+
+    def set(self, user_id, user):
+        self.entries[user_id] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(user_id)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+user_cache = SocketUserCache(settings.WS_AUTH_USER_CACHE_SECONDS)
+_in_flight = {}
+_lookup_slots = None
+
+def lookup_slots():
+    # Caps concurrent cold lookups so a reconnect storm can't take every
+    # thread-pool worker and DB connection at once
+    global _lookup_slots
+    if _lookup_slots is None:
+        _lookup_slots = asyncio.Semaphore(settings.WS_AUTH_MAX_CONCURRENT_LOOKUPS)
+    return _lookup_slots
+
 @database_sync_to_async
-def get_user_from_token(token):
+def load_socket_user(user_id):
+    row = User.objects.filter(id=user_id).values(*SOCKET_USER_FIELDS).first()
+    return SocketUser(**row) if row else None
+
+async def resolve_user(user_id):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    # Handshakes for the same user during a miss share one lookup
+    pending = _in_flight.get(user_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[user_id] = future
     try:
-        validated_token = UntypedToken(token)
-        user_id = validated_token['user_id']
-        user = User.objects.get(id=user_id)
+        async with lookup_slots():
+            user = await load_socket_user(user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
+        future.set_result(user)
         return user
-    except (User.DoesNotExist, InvalidToken, TokenError) as e:
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        _in_flight.pop(user_id, None)
+
+async def get_user_from_token(token):
+    try:
+        validated_token = UntypedToken(token)
+        # Tokens carrying the user claims need no lookup at all
+        if all(claim in validated_token for claim in ClaimsUser.TOKEN_CLAIMS):
+            return SocketUser(validated_token['user_id'], *(validated_token[claim] for claim in ClaimsUser.TOKEN_CLAIMS))
+        user = await resolve_user(validated_token['user_id'])
+    except (KeyError, InvalidToken, TokenError):
         return AnonymousUser()
+    return user or AnonymousUser()
 
 class JWTAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
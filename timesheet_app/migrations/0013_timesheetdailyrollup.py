@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    Timesheet = apps.get_model('timesheet_app', 'Timesheet')
+    TimesheetDailyRollup = apps.get_model('timesheet_app', 'TimesheetDailyRollup')
+    rows = (
+        Timesheet.objects.values('created_by_id', 'project_id', 'date', 'status')
+        .annotate(total_hours=models.Sum('hours'), total_entries=models.Count('id'))
+        .order_by()
+    )
+    TimesheetDailyRollup.objects.bulk_create(
+        [
+            TimesheetDailyRollup(
+                user_id=row['created_by_id'],
+                project_id=row['project_id'],
+                date=row['date'],
+                status=row['status'],
+                hours=row['total_hours'] or 0,
+                entries=row['total_entries'],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0012_alter_timesheet_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimesheetDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('Draft', 'Draft'), ('Submitted', 'Submitted for Review'), ('Approved', 'Approved'), ('Rejected', 'Rejected')], max_length=20)),
+                ('hours', models.DecimalField(decimal_places=1, default=0, max_digits=9)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timesheet_app.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timesheet_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'project', 'date', 'status')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0013_timesheetdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['created_by', 'date'], name='timesheet_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['submitted_to', 'status', '-date'], name='timesheet_review_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timesheet',
+            index=models.Index(fields=['status', 'date'], name='timesheet_status_date_idx'),
+        ),
+    ]
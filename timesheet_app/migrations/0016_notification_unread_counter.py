@@ -0,0 +1,34 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+def count_unread(apps, schema_editor):
+    CustomUser = apps.get_model('timesheet_app', 'CustomUser')
+    Notification = apps.get_model('timesheet_app', 'Notification')
+    counts = (
+        Notification.objects.filter(is_read=False)
+        .values('user_id').annotate(unread=models.Count('id')).order_by()
+    )
+    for row in counts:
+        CustomUser.objects.filter(id=row['user_id']).update(unread_notification_count=row['unread'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0015_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notification_user_read_idx'),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0016_notification_unread_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='broadcast_group',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
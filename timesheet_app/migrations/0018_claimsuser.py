@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-18 02:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0017_outboxmessage_broadcast_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimsUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('timesheet_app.customuser',),
+        ),
+    ]
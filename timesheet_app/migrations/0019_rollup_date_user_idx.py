@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timesheet_app', '0018_claimsuser'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timesheetdailyrollup',
+            index=models.Index(fields=['date', 'user'], name='rollup_date_user_idx'),
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from timesheet_app.utils import bump_rollup_generations
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, username, email, password=None, **extra_fields):
@@ -59,6 +63,8 @@ class CustomUser(AbstractUser):
     team = models.CharField(max_length=50, choices=TEAM_CHOICES, null=True, blank=True)
     subteam = models.CharField(max_length=50, choices=SUBTEAM_CHOICES, null=True, blank=True)
     chat_id = models.CharField(max_length=50, default='1234567890')
+    # Kept in step with Notification writes, see Notification.adjust_unread_counts
+    unread_notification_count = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
     
@@ -72,6 +78,47 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.firstname
 
+
+# Request user rebuilt from access-token claims instead of a query. The claimed
+# fields are loaded; the first access to any other field fetches the rest of
+# the row in one query.
+class ClaimsUser(CustomUser):
+    TOKEN_CLAIMS = ("username", "usertype", "team")
+
+    class Meta:
+        proxy = True
+
+    _token_claims = {}
+
+    @classmethod
+    def from_claims(cls, user_id, claims):
+        loaded = {"id": user_id, **{claim: claims[claim] for claim in cls.TOKEN_CLAIMS}}
+        field_names = [f.attname for f in cls._meta.concrete_fields if f.attname in loaded]
+        user = cls.from_db("default", field_names, [loaded[name] for name in field_names])
+        user._token_claims = {claim: claims[claim] for claim in cls.TOKEN_CLAIMS}
+        return user
+
+    def save(self, *args, **kwargs):
+        # Values still as the token had them may be stale, so they are never
+        # written back; claimed fields the caller changed are saved as usual
+        token_sourced = {claim for claim, value in self._token_claims.items() if getattr(self, claim) == value}
+        if token_sourced and self.pk is not None:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    f.attname for f in self._meta.concrete_fields
+                    if not f.primary_key and f.attname not in deferred
+                ]
+            kwargs["update_fields"] = [name for name in update_fields if name not in token_sourced]
+        return super().save(*args, **kwargs)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        return super().refresh_from_db(using=using, fields=fields, **kwargs)
+
 # Admin User
 class Admin(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
@@ -259,10 +306,78 @@ class Timesheet(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     rejected_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Own timesheets for a day (TimesheetListView)
+            models.Index(fields=["created_by", "date"], name="timesheet_user_date_idx"),
+            # Reviewer queue ordered by date (TimesheetsPendingReviewView)
+            models.Index(fields=["submitted_to", "status", "-date"], name="timesheet_review_queue_idx"),
+            # Approved history by date (ApprovedTimesheetsView)
+            models.Index(fields=["status", "date"], name="timesheet_status_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.created_by.username} - {self.task} on {self.date}"
 
 
+# Daily hours rollup, one row per (user, project, date, status)
+class TimesheetDailyRollup(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timesheet_rollups')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True)
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Timesheet.STATUS_CHOICES)
+    hours = models.DecimalField(max_digits=9, decimal_places=1, default=0)
+    entries = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "project", "date", "status")
+        indexes = [
+            # Date-range reports across all users (the unique index leads on user)
+            models.Index(fields=["date", "user"], name="rollup_date_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.date} - {self.status}: {self.hours}h"
+
+    @classmethod
+    def aggregate_timesheets(cls, timesheets):
+        rows = (
+            timesheets.values('created_by_id', 'project_id', 'date', 'status')
+            .annotate(total_hours=Sum('hours'), total_entries=Count('id'))
+            .order_by()
+        )
+        return [
+            cls(
+                user_id=row['created_by_id'],
+                project_id=row['project_id'],
+                date=row['date'],
+                status=row['status'],
+                hours=row['total_hours'] or 0,
+                entries=row['total_entries'],
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def refresh(cls, keys):
+        # Recomputes the rollup for the given (user_id, date) keys from the raw
+        # timesheets. Filters on users x dates, a superset of the keys, so the
+        # cost stays at three queries however many rows a batch touched.
+        keys = set(keys)
+        if not keys:
+            return
+        user_ids = {user_id for user_id, _ in keys}
+        dates = {day for _, day in keys}
+
+        with transaction.atomic():
+            cls.objects.filter(user_id__in=user_ids, date__in=dates).delete()
+            cls.objects.bulk_create(cls.aggregate_timesheets(
+                Timesheet.objects.filter(created_by_id__in=user_ids, date__in=dates)
+            ))
+            # Expire cached reports only once the new totals are visible
+            transaction.on_commit(lambda: bump_rollup_generations(dates))
+
+
 # TimesheetReview Model
 class TimesheetReview(models.Model):
     reviewed_by = models.ForeignKey(
@@ -285,6 +400,7 @@ class TimesheetReview(models.Model):
     reviewed_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # The unique index also serves the rejection feedback lookups
         unique_together = ("reviewed_user", "review_date")
 
     def __str__(self):
@@ -303,9 +419,63 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "is_read", "created_at"], name="notification_user_read_idx"),
+        ]
+
     def __str__(self):
          return f"Notification for {self.user.username} {self.created_at}"
 
+    @staticmethod
+    def adjust_unread_counts(deltas):
+        # deltas: {user_id: change}; one UPDATE per distinct change value
+        by_delta = {}
+        for user_id, delta in deltas.items():
+            if delta:
+                by_delta.setdefault(delta, []).append(user_id)
+        for delta, user_ids in by_delta.items():
+            CustomUser.objects.filter(id__in=user_ids).update(
+                unread_notification_count=Greatest(F('unread_notification_count') + delta, 0)
+            )
+
+
+# Outbox of pending Telegram / WebSocket deliveries, written in the same
+# transaction as the change that triggers them and drained by run_outbox_worker
+class OutboxMessage(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('failed', 'Failed'),
+    ]
+
+    notification = models.ForeignKey(
+        Notification,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="outbox_messages"
+    )
+    chat_id = models.CharField(max_length=50, blank=True)
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    telegram_sent = models.BooleanField(default=False)
+    pushed = models.BooleanField(default=False)
+    # Team/project channel group the push can share with other recipients
+    broadcast_group = models.CharField(max_length=50, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} ({self.status}, {self.attempts} attempts)"
+
     
     
 # Signals to automatically create role-specific models
@@ -329,5 +499,12 @@ def save_role_specific_model(sender, instance, **kwargs):
         instance.user.save()
 
 
-
-
+# Rollup rows removed by cascade with their project or user skip
+# TimesheetDailyRollup.refresh, so expire the cached months they covered here
+@receiver(pre_delete, sender=Project)
+@receiver(pre_delete, sender=CustomUser)
+def expire_rollups_on_cascade(sender, instance, **kwargs):
+    field = "project" if sender is Project else "user"
+    months = list(TimesheetDailyRollup.objects.filter(**{field: instance}).dates("date", "month"))
+    if months:
+        transaction.on_commit(lambda: bump_rollup_generations(months))
@@ -1,21 +1,160 @@
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Q
+import asyncio
+import logging
+from timesheet_app.models import Project, Team
 from timesheet_app.serializers import NotificationSerializer
+from timesheet_app.presence import get_presence, online_users
 
-def send_notification_to_user(notification):
+logger = logging.getLogger(__name__)
+
+def send_notifications(notifications, groups=None):
+    # Pushes many notifications in a single event-loop pass instead of one
+    # blocking group_send per user. Notifications sharing a team_/project_
+    # group and message go out as one group_send carrying the message once
+    # plus a {user_id: notification_id} map; each socket builds its own copy.
+    # Returns one error (or None) per notification.
     channel_layer = get_channel_layer()
-    if not channel_layer:
-        return
+    if not channel_layer or not notifications:
+        return [None] * len(notifications)
+    groups = groups or [""] * len(notifications)
+
+    # Offline users are skipped outright; they catch up on their next connect.
+    # Without presence (fail open) nobody can be joined to a group, so group
+    # pushes fall back to per-user sends.
+    user_ids = {notification.user_id for notification in notifications}
+    try:
+        channels = get_presence().channels_for(user_ids)
+        online = {user_id for user_id, names in channels.items() if names}
+    except Exception as e:
+        logger.warning("Presence lookup failed, pushing to all: %s", e)
+        channels, online = None, user_ids
+
+    sends = []
+    shared = {}
+    joins = set()
+    for index, (notification, group) in enumerate(zip(notifications, groups)):
+        if notification.user_id not in online:
+            continue
+        if not group or channels is None:
+            sends.append(([index], f"user_{notification.user_id}", {
+                "type": "send.notification",
+                "notification": NotificationSerializer(notification).data,
+            }))
+            continue
+        key = (group, notification.message)
+        if key not in shared:
+            shared[key] = ([], group, {
+                "type": "send.group_notification",
+                "group": group,
+                "notification": NotificationSerializer(notification).data,
+                "recipients": {},
+            })
+            sends.append(shared[key])
+        indexes, _, event = shared[key]
+        indexes.append(index)
+        event["recipients"][str(notification.user_id)] = notification.id
+        joins.update((group, channel_name) for channel_name in channels[notification.user_id])
+
+    results = [None] * len(notifications)
+    if not sends:
+        return results
+
+    async def push_all():
+        # Recipients' sockets join the group first, so members added since
+        # they connected get the push too. group_add is idempotent.
+        try:
+            await asyncio.gather(*(channel_layer.group_add(group, name) for group, name in joins))
+        except Exception as e:
+            return [e] * len(sends)
+        return await asyncio.gather(
+            *(channel_layer.group_send(group_name, event) for _, group_name, event in sends),
+            return_exceptions=True,
+        )
+
+    for (indexes, _, _), result in zip(sends, async_to_sync(push_all)()):
+        if isinstance(result, Exception):
+            for index in indexes:
+                results[index] = result
+    return results
+
+def broadcast_groups_for(user_ids):
+    # {user_id: team and project groups its sockets join besides user_{id}},
+    # in a fixed number of queries however many users are asked about
+    user_ids = {int(user_id) for user_id in user_ids}
+    teams = {user_id: set() for user_id in user_ids}
+    for through in (Team.members.through, Team.account_managers.through):
+        for user_id, team_id in through.objects.filter(customuser_id__in=user_ids).values_list("customuser_id", "team_id"):
+            teams[user_id].add(team_id)
+    leader_fields = ("team_leader_search", "team_leader_development", "team_leader_creative")
+    led = Team.objects.filter(
+        Q(team_leader_search__in=user_ids) | Q(team_leader_development__in=user_ids) |
+        Q(team_leader_creative__in=user_ids)
+    ).values_list("id", *leader_fields)
+    for team_id, *leaders in led:
+        for leader_id in leaders:
+            if leader_id in teams:
+                teams[leader_id].add(team_id)
 
-    user = notification.user
-    group_name = f"user_{user.id}"
+    team_ids = set().union(*teams.values())
+    projects = defaultdict(set)
+    if team_ids:
+        for through in (Project.teams.through, Team.projects.through):
+            for team_id, project_id in through.objects.filter(team_id__in=team_ids).values_list("team_id", "project_id"):
+                projects[team_id].add(project_id)
 
-    serialized_data = NotificationSerializer(notification).data
+    return {
+        user_id: {f"team_{team_id}" for team_id in team_ids}
+        | {f"project_{project_id}" for team_id in team_ids for project_id in projects[team_id]}
+        for user_id, team_ids in teams.items()
+    }
+
+def drop_broadcast_groups(user_ids, groups):
+    # Call when a membership change may remove users from these groups. Once
+    # it commits, their open sockets leave the groups they no longer belong
+    # to. Joins need no counterpart: send_notifications adds recipients to a
+    # group right before pushing to it. Failures only leave a stale
+    # subscription, which the consumer filters out anyway.
+    user_ids, groups = set(user_ids), set(groups)
+
+    def apply():
+        channel_layer = get_channel_layer()
+        if not channel_layer or not user_ids or not groups:
+            return
+        try:
+            channels = get_presence().channels_for(user_ids)
+            online = [user_id for user_id, names in channels.items() if names]
+            if not online:
+                return
+            memberships = broadcast_groups_for(online)
+            leaves = [
+                (group, channel_name)
+                for user_id in online
+                for channel_name in channels[user_id]
+                for group in groups - memberships[int(user_id)]
+            ]
+
+            async def run():
+                await asyncio.gather(*(channel_layer.group_discard(group, name) for group, name in leaves))
+            if leaves:
+                async_to_sync(run)()
+        except Exception as e:
+            logger.warning("Could not drop stale broadcast groups: %s", e)
+
+    transaction.on_commit(apply)
+
+def send_read_state(user_id, payload):
+    channel_layer = get_channel_layer()
+    if not channel_layer or not online_users([user_id]):
+        return
 
     async_to_sync(channel_layer.group_send)(
-        group_name,
+        f"user_{user_id}",
         {
-            "type": "send.notification",  
-            "notification": serialized_data,
+            "type": "notifications.read",
+            "payload": payload,
         }
     )
@@ -0,0 +1,142 @@
+import logging
+import uuid
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from timesheet_app.models import Notification, OutboxMessage
+from timesheet_app.notification_ws import send_notifications
+from timesheet_app.utils import send_telegram_message
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF_SECONDS = 300
+CLAIM_LEASE = timedelta(minutes=2)
+
+
+"""
+                                Queueing
+"""
+# Call these inside the transaction that makes the change; the worker only
+# sees the rows once it commits.
+def queue_notification(user, message, telegram=True):
+    notification = Notification.objects.create(user=user, message=message)
+    Notification.adjust_unread_counts({user.id: 1})
+    OutboxMessage.objects.create(
+        notification=notification,
+        chat_id=(user.chat_id or "") if telegram else "",
+        message=message,
+    )
+    return notification
+
+def queue_notifications(items, group=""):
+    # items: iterable of (user_id, chat_id, message). With a team_/project_
+    # group, the worker pushes the batch as one group_send to that group.
+    items = list(items)
+    notifications = Notification.objects.bulk_create(
+        [Notification(user_id=user_id, message=message) for user_id, _, message in items]
+    )
+    OutboxMessage.objects.bulk_create([
+        OutboxMessage(
+            notification=notification,
+            chat_id=chat_id or "",
+            message=notification.message,
+            broadcast_group=group or "",
+        )
+        for notification, (_, chat_id, _) in zip(notifications, items)
+    ])
+    Notification.adjust_unread_counts(Counter(user_id for user_id, _, _ in items))
+    return notifications
+
+def notify_many(users, message, telegram=True, group=""):
+    # Same message to many users: duplicates collapse to one row per user and
+    # everything is written with a single bulk insert per table
+    recipients = {user.id: user for user in users}
+    return queue_notifications(
+        [(user.id, user.chat_id if telegram else "", message) for user in recipients.values()],
+        group=group,
+    )
+
+def queue_telegram(chat_id, message):
+    # Telegram only, no in-app notification
+    if chat_id:
+        OutboxMessage.objects.create(chat_id=chat_id, message=message)
+
+
+"""
+                                Delivery
+"""
+def claim_batch(batch_size):
+    # Leases due rows to this worker; a crashed worker's lease simply expires
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due_ids = list(
+        OutboxMessage.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not due_ids:
+        return []
+    OutboxMessage.objects.filter(
+        id__in=due_ids, status='pending', next_attempt_at__lte=now
+    ).update(claim_token=token, next_attempt_at=now + CLAIM_LEASE)
+    return list(
+        OutboxMessage.objects.filter(claim_token=token, status='pending')
+        .select_related('notification')
+        .order_by('id')
+    )
+
+def deliver_telegram(outbox_message):
+    if outbox_message.chat_id and not outbox_message.telegram_sent:
+        result = send_telegram_message(outbox_message.chat_id, outbox_message.message)
+        if isinstance(result, dict) and result.get("ok") is False:
+            raise RuntimeError(f"Telegram error: {result.get('description', result)}")
+        outbox_message.telegram_sent = True
+
+def process_batch(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    batch = claim_batch(batch_size)
+    errors = {}
+
+    for outbox_message in batch:
+        try:
+            deliver_telegram(outbox_message)
+        except Exception as e:
+            errors[outbox_message.id] = e
+
+    # All WebSocket pushes for the batch go out in one pass
+    to_push = [m for m in batch if m.notification and not m.pushed]
+    push_results = send_notifications(
+        [m.notification for m in to_push],
+        groups=[m.broadcast_group for m in to_push],
+    )
+    for outbox_message, error in zip(to_push, push_results):
+        if error is None:
+            outbox_message.pushed = True
+        else:
+            errors.setdefault(outbox_message.id, error)
+
+    delivered, failed = [], []
+    for outbox_message in batch:
+        error = errors.get(outbox_message.id)
+        if error is None:
+            delivered.append(outbox_message.id)
+            continue
+        logger.warning("Outbox delivery %s failed: %s", outbox_message.id, error)
+        outbox_message.attempts += 1
+        outbox_message.last_error = str(error)
+        if outbox_message.attempts >= max_attempts:
+            outbox_message.status = 'failed'
+        else:
+            backoff = min(2 ** outbox_message.attempts, MAX_BACKOFF_SECONDS)
+            outbox_message.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+        outbox_message.claim_token = ""
+        failed.append(outbox_message)
+
+    with transaction.atomic():
+        OutboxMessage.objects.filter(id__in=delivered).delete()
+        OutboxMessage.objects.bulk_update(
+            failed,
+            ['attempts', 'last_error', 'status', 'next_attempt_at', 'claim_token', 'telegram_sent', 'pushed'],
+        )
+    return len(batch)
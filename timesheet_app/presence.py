@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# Which users have a live notification socket. Each socket is an entry that
+# expires unless its consumer refreshes it, so sockets on a crashed process
+# drop out on their own after PRESENCE_TTL_SECONDS.
+class InMemoryPresence:
+    # Single process only (tests, runserver): the pushing process must be the
+    # one holding the sockets
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def touch(self, user_id, channel_name):
+        with self.lock:
+            self.entries.setdefault(str(user_id), {})[channel_name] = time.time() + self.ttl
+
+    def remove(self, user_id, channel_name):
+        with self.lock:
+            channels = self.entries.get(str(user_id), {})
+            channels.pop(channel_name, None)
+            if not channels:
+                self.entries.pop(str(user_id), None)
+
+    def channels_for(self, user_ids):
+        now = time.time()
+        with self.lock:
+            return {
+                user_id: [name for name, expires in self.entries.get(str(user_id), {}).items() if expires > now]
+                for user_id in user_ids
+            }
+
+    def online(self, user_ids):
+        now = time.time()
+        with self.lock:
+            return {
+                user_id for user_id in user_ids
+                if any(expires > now for expires in self.entries.get(str(user_id), {}).values())
+            }
+
+
+class RedisPresence:
+    # One sorted set per user: member = channel name, score = expiry time
+    def __init__(self, ttl, url=None):
+        import redis
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url or os.getenv("REDIS_URL"))
+
+    def key(self, user_id):
+        return f"presence:{user_id}"
+
+    def touch(self, user_id, channel_name):
+        key = self.key(user_id)
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {channel_name: time.time() + self.ttl})
+        pipe.zremrangebyscore(key, "-inf", time.time())
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def remove(self, user_id, channel_name):
+        self.client.zrem(self.key(user_id), channel_name)
+
+    def channels_for(self, user_ids):
+        user_ids = list(user_ids)
+        now = time.time()
+        pipe = self.client.pipeline()
+        for user_id in user_ids:
+            pipe.zrangebyscore(self.key(user_id), now, "+inf")
+        return {
+            user_id: [name.decode() for name in names]
+            for user_id, names in zip(user_ids, pipe.execute())
+        }
+
+    def online(self, user_ids):
+        user_ids = list(user_ids)
+        now = time.time()
+        pipe = self.client.pipeline()
+        for user_id in user_ids:
+            pipe.zcount(self.key(user_id), now, "+inf")
+        return {user_id for user_id, count in zip(user_ids, pipe.execute()) if count}
+
+
+_presence = None
+_presence_lock = threading.Lock()
+
+def get_presence():
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                _presence = import_string(settings.PRESENCE_BACKEND)(settings.PRESENCE_TTL_SECONDS)
+    return _presence
+
+def online_users(user_ids):
+    # Fails open: if the registry is unreachable, treat everyone as online
+    user_ids = set(user_ids)
+    try:
+        return get_presence().online(user_ids)
+    except Exception as e:
+        logger.warning("Presence lookup failed, pushing to all: %s", e)
+        return user_ids
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import CustomUser, Timesheet,  Project, Team, Department,TimesheetReview,Notification
+from django.db import transaction
+from django.utils.encoding import smart_str
+from .models import CustomUser, Timesheet,  Project, Team, Department,TimesheetReview,Notification,TimesheetDailyRollup
 
 
 # CustomUserSerializer is used to serialize the CustomUser model
@@ -20,16 +22,131 @@ class DepartmentSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         
 
+# Feedback of rejected rows keyed by (user_id, date), fetched in one query so
+# TimesheetSerializer doesn't look up a review per row
+def build_rejection_feedback_map(timesheets):
+    rejected = [ts for ts in timesheets if ts.status == "Rejected"]
+    if not rejected:
+        return {}
+
+    reviews = TimesheetReview.objects.filter(
+        action="reject",
+        reviewed_user_id__in={ts.created_by_id for ts in rejected},
+        review_date__in={ts.date for ts in rejected},
+    ).values_list('reviewed_user_id', 'review_date', 'feedback')
+    return {(user_id, review_date): feedback or "" for user_id, review_date, feedback in reviews}
+
+
+# Resolves slugs from the lookups prefetched by TimesheetListSerializer,
+# falling back to a per-value query when used outside a batch
+class PrefetchedSlugRelatedField(serializers.SlugRelatedField):
+    def to_internal_value(self, data):
+        lookups = getattr(self.root, 'slug_lookups', None)
+        if lookups is None or self.field_name not in lookups:
+            return super().to_internal_value(data)
+
+        lookup = lookups[self.field_name]
+        key = smart_str(data)
+        if key not in lookup:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=key)
+        if lookup[key] is None:
+            # Slug matched more than one row
+            self.fail('invalid')
+        return lookup[key]
+
+
+# Batch mode for TimesheetSerializer(many=True): one lookup query per slug
+# field for the whole payload and a single bulk INSERT on save.
+# Bulk edits pass a {str(id): Timesheet} map as the instance; rows with a
+# known id are validated as partial updates and the rest as new timesheets.
+class TimesheetListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        self.edit_targets = []
+        if isinstance(data, list):
+            self.slug_lookups = self.build_slug_lookups(data)
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if isinstance(self.instance, dict):
+            row_id = data.get('id') if isinstance(data, dict) else None
+            target = self.instance.get(smart_str(row_id)) if row_id else None
+            self.child.instance = target
+            self.child.initial_data = data
+            self.partial = target is not None
+            self.edit_targets.append(target)
+        return super().run_child_validation(data)
+
+    def build_slug_lookups(self, data):
+        lookups = {}
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, PrefetchedSlugRelatedField):
+                continue
+
+            values = {
+                smart_str(item[name]) for item in data
+                if isinstance(item, dict) and item.get(name) not in (None, '')
+            }
+            lookup = {}
+            if values:
+                queryset = field.get_queryset().filter(**{f'{field.slug_field}__in': values})
+                for obj in queryset:
+                    key = smart_str(getattr(obj, field.slug_field))
+                    lookup[key] = None if key in lookup else obj
+            lookups[name] = lookup
+        return lookups
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        timesheets = []
+        for attrs in validated_data:
+            if request and hasattr(request, 'user'):
+                attrs['created_by'] = request.user
+            timesheets.append(Timesheet(**attrs))
+
+        with transaction.atomic():
+            created = Timesheet.objects.bulk_create(timesheets)
+            TimesheetDailyRollup.refresh((ts.created_by_id, ts.date) for ts in created)
+        return created
+
+    def update(self, instance, validated_data):
+        request = self.context.get('request')
+        results, to_update, to_create = [], [], []
+        update_fields = set()
+        # Keys before and after the edit, since date can move
+        rollup_keys = {(ts.created_by_id, ts.date) for ts in self.edit_targets if ts is not None}
+
+        for target, attrs in zip(self.edit_targets, validated_data):
+            if target is None:
+                if request and hasattr(request, 'user'):
+                    attrs['created_by'] = request.user
+                target = Timesheet(**attrs)
+                to_create.append(target)
+            else:
+                for attr, value in attrs.items():
+                    setattr(target, attr, value)
+                update_fields.update(attrs)
+                to_update.append(target)
+            results.append(target)
+            rollup_keys.add((target.created_by_id, target.date))
+
+        with transaction.atomic():
+            if to_update and update_fields:
+                Timesheet.objects.bulk_update(to_update, update_fields)
+            Timesheet.objects.bulk_create(to_create)
+            TimesheetDailyRollup.refresh(rollup_keys)
+        return results
+
+
 class TimesheetSerializer(serializers.ModelSerializer):
-    project = serializers.SlugRelatedField(
+    project = PrefetchedSlugRelatedField(
         slug_field='name',
         queryset=Project.objects.all()
     )
-    department = serializers.SlugRelatedField(
+    department = PrefetchedSlugRelatedField(
         slug_field='name',
         queryset=Department.objects.all()
     )
-    submitted_to = serializers.SlugRelatedField(
+    submitted_to = PrefetchedSlugRelatedField(
         slug_field='username',
         queryset=CustomUser.objects.all(),
         allow_null=True,
@@ -40,6 +157,7 @@ class TimesheetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Timesheet
+        list_serializer_class = TimesheetListSerializer
         fields = [
             'id',
             'date',
@@ -59,6 +177,9 @@ class TimesheetSerializer(serializers.ModelSerializer):
         
     def get_rejection_feedback(self, obj):
         if obj.status == "Rejected":
+            feedback_map = self.context.get('rejection_feedback')
+            if feedback_map is not None:
+                return feedback_map.get((obj.created_by_id, obj.date), "")
             review = TimesheetReview.objects.filter(
                 reviewed_user=obj.created_by,
                 review_date=obj.date,
@@ -71,7 +192,10 @@ class TimesheetSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             validated_data['created_by'] = request.user
-        return super().create(validated_data) 
+        with transaction.atomic():
+            timesheet = super().create(validated_data)
+            TimesheetDailyRollup.refresh([(timesheet.created_by_id, timesheet.date)])
+        return timesheet
    
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
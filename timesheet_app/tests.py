@@ -1,3 +1,498 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+from datetime import date, timedelta
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from unittest import skipUnless
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from timesheet_app import authentication, consumers, notification_ws, utils
+from timesheet_app.routing import websocket_urlpatterns
+from timesheet_app.models import (
+    ClaimsUser, CustomUser, Notification, Project, Team, Timesheet, TimesheetDailyRollup, TimesheetReview,
+)
+from timesheet_app.presence import InMemoryPresence
 
-# Create your tests here.
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            "alice", "alice@example.com", "pw", usertype="User", team="Search", chat_id="42",
+        )
+        authentication.validated_tokens.clear()
+
+    def login(self):
+        client = APIClient()
+        response = client.post("/api/login/", {"username": "alice", "password": "pw"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        return client, response.json()["access_token"]
+
+    def test_claims_token_skips_user_query(self):
+        _, access = self.login()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/api/notifications/unread-count/")
+        self.assertEqual(response.status_code, 200)
+        # Only the unread counter itself
+        self.assertEqual(len(queries), 1)
+
+    def test_claims_user_loads_deferred_fields_in_one_query(self):
+        _, access = self.login()
+        user = authentication.ClaimsJWTAuthentication().get_user(AccessToken(access))
+        self.assertIsInstance(user, ClaimsUser)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.id, user.username, user.usertype, user.team), (self.user.id, "alice", "User", "Search"))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "alice@example.com")
+            self.assertEqual(user.chat_id, "42")
+        self.assertEqual(user, self.user)
+
+    def test_legacy_token_without_claims_uses_db_lookup(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        user = authentication.ClaimsJWTAuthentication().get_user(AccessToken(access))
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertEqual(user.pk, self.user.pk)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(client.get("/api/notifications/unread-count/").status_code, 200)
+        CustomUser.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(client.get("/api/notifications/unread-count/").status_code, 401)
+
+    def test_change_password_keeps_current_role_and_team(self):
+        client, access = self.login()
+        CustomUser.objects.filter(id=self.user.id).update(team="Development", usertype="TeamLeader")
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = client.post("/api/change-password/", {
+            "current_password": "pw", "new_password": "new-pw", "confirm_password": "new-pw",
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        user = CustomUser.objects.get(id=self.user.id)
+        self.assertEqual((user.team, user.usertype), ("Development", "TeamLeader"))
+        self.assertTrue(user.check_password("new-pw"))
+
+    def test_claims_user_save_never_writes_token_values(self):
+        _, access = self.login()
+        CustomUser.objects.filter(id=self.user.id).update(team="Development", usertype="TeamLeader")
+        user = authentication.ClaimsJWTAuthentication().get_user(AccessToken(access))
+        user.chat_id = "99"
+        user.username = "alice2"
+        user.save()
+        row = CustomUser.objects.get(id=self.user.id)
+        self.assertEqual((row.team, row.usertype), ("Development", "TeamLeader"))
+        self.assertEqual((row.chat_id, row.username), ("99", "alice2"))
+
+    def test_refresh_rejects_inactive_user(self):
+        client, _ = self.login()
+        CustomUser.objects.filter(id=self.user.id).update(is_active=False)
+        response = client.post("/api/token/refresh/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_no_claims_for_inactive_user(self):
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        token = authentication.add_user_claims(RefreshToken.for_user(self.user).access_token, self.user)
+        self.assertNotIn("usertype", token)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(client.get("/api/notifications/unread-count/").status_code, 401)
+
+
+@skipUnless(connection.vendor == "sqlite", "asserts on SQLite's EXPLAIN QUERY PLAN output")
+class TimesheetQueryPlanTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="User")
+        self.admin = CustomUser.objects.create_user("boss", "boss@example.com", "pw", usertype="Admin")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertRegex(plan, r"USING (COVERING )?INDEX")
+        self.assertNotRegex(plan, r"SCAN timesheet_app_", plan)
+
+    def test_timesheet_list_by_user_and_date(self):
+        self.assertUsesIndex(Timesheet.objects.filter(created_by=self.user, date="2025-06-01"))
+
+    def test_pending_review_queue(self):
+        self.assertUsesIndex(
+            Timesheet.objects.filter(submitted_to=self.admin, status="Submitted").order_by("-date", "submitted_at")
+        )
+
+    def test_approved_by_date(self):
+        self.assertUsesIndex(Timesheet.objects.filter(status="Approved", date="2025-06-01").order_by("date", "id"))
+        self.assertUsesIndex(Timesheet.objects.filter(status="Approved", date__year=2025, date__month=6))
+
+    def test_rejection_feedback_lookup(self):
+        self.assertUsesIndex(
+            TimesheetReview.objects.filter(
+                action="reject", reviewed_user_id__in=[self.user.id], review_date__in=["2025-06-01"],
+            )
+        )
+
+    def test_rollup_date_range_report(self):
+        self.assertUsesIndex(
+            TimesheetDailyRollup.objects.filter(date__gte="2025-06-01", date__lte="2025-06-30")
+            .values("user_id").annotate(hours=Sum("hours")).order_by()
+        )
+
+
+class ApprovedExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="Admin")
+        for day in range(1, 4):
+            Timesheet.objects.create(
+                date=date(2025, 6, day), task=f"task {day}", created_by=self.user, hours=2, status="Approved",
+            )
+        self.access = str(AccessToken.for_user(self.user))
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        response = await AsyncClient().get(
+            "/api/timesheets/approved-timesheets/", {"export": "ndjson"},
+            headers={"Authorization": f"Bearer {self.access}"},
+        )
+        self.assertEqual(response.status_code, 200)
+        # An async iterator is sent as it is read instead of being collected first
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row["task"] for row in rows], ["task 1", "task 2", "task 3"])
+
+
+class PurgeNotificationsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="User")
+        now = timezone.now()
+        ages = [
+            ("old-read", 400, True), ("old-unread", 400, False),
+            ("stale-read", 100, True), ("stale-unread", 100, False),
+            ("recent-read", 10, True), ("recent-unread", 10, False),
+        ]
+        # Interleave expired and kept rows so chunks of 2 ids mix both
+        for message, days, is_read in ages * 2:
+            notification = Notification.objects.create(user=self.user, message=message, is_read=is_read)
+            Notification.objects.filter(id=notification.id).update(created_at=now - timedelta(days=days))
+        CustomUser.objects.filter(id=self.user.id).update(
+            unread_notification_count=Notification.objects.filter(is_read=False).count()
+        )
+
+    def purge(self, *args):
+        call_command("purge_notifications", "--read-days=90", "--unread-days=365", "--sleep=0", *args, stdout=io.StringIO())
+
+    def unread_count(self):
+        return CustomUser.objects.get(id=self.user.id).unread_notification_count
+
+    def test_dry_run_deletes_nothing(self):
+        self.purge("--dry-run")
+        self.assertEqual(Notification.objects.count(), 12)
+        self.assertEqual(self.unread_count(), 6)
+
+    def test_chunked_purge_removes_only_expired_rows(self):
+        self.purge("--chunk-size=2")
+        self.assertEqual(
+            sorted(Notification.objects.values_list("message", flat=True)),
+            sorted(["stale-unread", "recent-read", "recent-unread"] * 2),
+        )
+        # The two old unread rows were purged
+        self.assertEqual(self.unread_count(), 4)
+
+
+class RollupCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="User")
+        self.project = Project.objects.create(
+            name="P", description="d", status="Ongoing", start_date="2025-01-01", deadline="2025-12-31",
+        )
+        TimesheetDailyRollup.objects.create(
+            user=self.user, project=self.project, date=date(2025, 6, 3), status="Approved", hours=4, entries=1,
+        )
+        self.june = (date(2025, 6, 1), date(2025, 6, 30))
+        self.generation = utils.rollup_generation(*self.june)
+
+    def test_cascade_delete_expires_cached_months(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+        self.assertFalse(TimesheetDailyRollup.objects.exists())
+        self.assertNotEqual(utils.rollup_generation(*self.june), self.generation)
+
+    def test_rebuild_expires_cached_months(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_timesheet_rollups", stdout=io.StringIO())
+        self.assertNotEqual(utils.rollup_generation(*self.june), self.generation)
+
+
+class RecordingChannelLayer:
+    def __init__(self):
+        self.sent = []
+        self.joined = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+    async def group_add(self, group, channel_name):
+        self.joined.append((group, channel_name))
+
+    async def group_discard(self, group, channel_name):
+        pass
+
+
+class GroupNotificationTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(f"member{i}", f"member{i}@example.com", "pw", usertype="User")
+            for i in range(3)
+        ]
+        self.layer = RecordingChannelLayer()
+        patcher = mock.patch.object(notification_ws, "get_channel_layer", return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.presence = InMemoryPresence(ttl=60)
+        presence = mock.patch.object(notification_ws, "get_presence", return_value=self.presence)
+        presence.start()
+        self.addCleanup(presence.stop)
+
+    def test_team_push_is_one_event_with_an_id_map(self):
+        for user in self.users:
+            self.presence.touch(user.id, f"channel-{user.id}")
+        notifications = Notification.objects.bulk_create(
+            [Notification(user=user, message="Team news") for user in self.users]
+        )
+        results = notification_ws.send_notifications(notifications, groups=["team_7"] * 3)
+
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(len(self.layer.sent), 1)
+        group, event = self.layer.sent[0]
+        self.assertEqual(group, "team_7")
+        self.assertEqual(event["notification"]["message"], "Team news")
+        self.assertEqual(
+            event["recipients"],
+            {str(notification.user_id): notification.id for notification in notifications},
+        )
+
+    def test_team_push_joins_recipient_sockets_first(self):
+        self.presence.touch(self.users[0].id, "channel-a")
+        notifications = Notification.objects.bulk_create(
+            [Notification(user=user, message="Team news") for user in self.users]
+        )
+        notification_ws.send_notifications(notifications, groups=["team_7"] * 3)
+
+        # Only the online user's socket is joined, and only they are recipients
+        self.assertEqual(self.layer.joined, [("team_7", "channel-a")])
+        self.assertEqual(list(self.layer.sent[0][1]["recipients"]), [str(self.users[0].id)])
+
+    def test_group_lookup_uses_fixed_number_of_queries(self):
+        project = Project.objects.create(
+            name="P", description="d", status="Ongoing", start_date="2025-01-01", deadline="2025-12-31",
+        )
+        team = Team.objects.create(name="T", description="d", created_by=self.users[0], team_leader_search=self.users[2])
+        team.members.set(self.users[:2])
+        team.projects.add(project)
+        with self.assertNumQueries(5):
+            groups = notification_ws.broadcast_groups_for([user.id for user in self.users])
+        expected = {f"team_{team.id}", f"project_{project.id}"}
+        self.assertEqual(groups, {user.id: expected for user in self.users})
+
+    def test_dropping_groups_survives_presence_outage(self):
+        with mock.patch.object(self.presence, "channels_for", side_effect=ConnectionError("redis down")):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                notification_ws.drop_broadcast_groups([self.users[0].id], ["team_7"])
+        self.assertEqual(len(callbacks), 1)
+
+
+def socket_app(user):
+    router = URLRouter(websocket_urlpatterns)
+
+    async def app(scope, receive, send):
+        scope["user"] = user
+        return await router(scope, receive, send)
+    return app
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ConsumerPresenceOutageTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="User")
+        broken = mock.Mock()
+        broken.touch.side_effect = broken.remove.side_effect = ConnectionError("redis down")
+        patcher = mock.patch.object(consumers, "get_presence", return_value=broken)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_socket_works_and_leaves_groups_without_presence(self):
+        async def run():
+            communicator = WebsocketCommunicator(socket_app(self.user), f"/ws/notifications/{self.user.id}/")
+            connected, _ = await communicator.connect()
+            layer = get_channel_layer()
+            joined = f"user_{self.user.id}" in layer.groups
+            await communicator.disconnect()
+            return connected, joined, f"user_{self.user.id}" in layer.groups
+
+        connected, joined, still_joined = async_to_sync(run)()
+        self.assertTrue(connected)
+        self.assertTrue(joined)
+        self.assertFalse(still_joined)
+
+
+    def test_socket_leaves_groups_a_push_joined_it_to(self):
+        presence = InMemoryPresence(ttl=60)
+
+        async def run():
+            communicator = WebsocketCommunicator(socket_app(self.user), f"/ws/notifications/{self.user.id}/")
+            await communicator.connect()
+            layer = get_channel_layer()
+            channel_name = next(iter(layer.groups[f"user_{self.user.id}"]))
+            joined_on_connect = set(layer.groups) - {f"user_{self.user.id}"}
+            presence.touch(self.user.id, channel_name)
+            notification = await database_sync_to_async(Notification.objects.create)(user=self.user, message="Team news")
+            await sync_to_async(notification_ws.send_notifications)([notification], groups=["team_7"])
+            frame = await communicator.receive_json_from()
+            joined = channel_name in layer.groups.get("team_7", {})
+            await communicator.disconnect()
+            return joined_on_connect, frame, joined, channel_name in layer.groups.get("team_7", {})
+
+        with mock.patch.object(notification_ws, "get_presence", return_value=presence):
+            joined_on_connect, frame, joined, still_joined = async_to_sync(run)()
+        self.assertEqual(joined_on_connect, set())
+        self.assertEqual(frame["message"], "Team news")
+        self.assertTrue(joined)
+        self.assertFalse(still_joined)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    NOTIFICATION_HEARTBEAT_SECONDS=0.1, NOTIFICATION_HEARTBEAT_MISSES=2,
+)
+class ConsumerHeartbeatTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", "alice@example.com", "pw", usertype="User")
+        patcher = mock.patch.object(consumers, "get_presence", return_value=InMemoryPresence(ttl=60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def frames_after_silence(self, query):
+        async def run():
+            communicator = WebsocketCommunicator(socket_app(self.user), f"/ws/notifications/{self.user.id}/{query}")
+            await communicator.connect()
+            await asyncio.sleep(0.5)
+            frames = []
+            while not await communicator.receive_nothing(timeout=0.05):
+                frames.append(await communicator.receive_output())
+            await communicator.disconnect()
+            return frames
+        return async_to_sync(run)()
+
+    def test_legacy_socket_gets_no_pings_and_stays_open(self):
+        self.assertEqual(self.frames_after_silence(""), [])
+
+    def test_opted_in_silent_socket_is_pinged_then_reaped(self):
+        frames = self.frames_after_silence("?heartbeat=1")
+        sent = [json.loads(frame["text"]) for frame in frames if frame["type"] == "websocket.send"]
+        self.assertEqual(sent[0], {"event": "heartbeat", "interval": 0.1})
+        self.assertIn({"event": "ping"}, sent)
+        self.assertEqual(frames[-1], {"type": "websocket.close", "code": 4408})
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    # Answers like the Bot API and records what it was sent
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        method = self.path.rsplit("/", 1)[-1]
+        if self.headers["Content-Type"].startswith("multipart/form-data"):
+            uploaded = True
+            chat_id = body.split(b'name="chat_id"\r\n\r\n', 1)[1].split(b"\r\n", 1)[0].decode()
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            uploaded = False
+            chat_id = fields["chat_id"]
+        self.server.calls.append({"method": method, "chat_id": chat_id, "uploaded": uploaded, "body": body})
+
+        result = {"chat": {"id": chat_id}}
+        if method == "sendDocument":
+            result["document"] = {"file_id": "stub-file-id"}
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TelegramClientTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStubHandler)
+        self.server.calls = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def telegram_client(self, **kwargs):
+        kwargs.setdefault("global_rate", 1000)
+        kwargs.setdefault("per_chat_rate", 1000)
+        return utils.TelegramClient("TOKEN", api_url=self.api_url, **kwargs)
+
+    def upload(self):
+        return SimpleUploadedFile("report.pdf", b"%PDF" * 1000, content_type="application/pdf")
+
+    def test_send_message_uses_api_url_from_env(self):
+        with mock.patch.dict(os.environ, {"TELEGRAM_BOT_TOKEN": "TOKEN", "TELEGRAM_API_URL": self.api_url}), \
+                mock.patch.object(utils, "_telegram_client", None):
+            result = utils.send_telegram_message("42", "<b>hi</b>")
+        self.assertTrue(result["ok"])
+        self.assertEqual(self.server.calls[0]["method"], "sendMessage")
+        self.assertIn(b"text=%3Cb%3Ehi%3C%2Fb%3E", self.server.calls[0]["body"])
+
+    def test_send_document_upload_and_file_id(self):
+        client = self.telegram_client()
+        self.assertTrue(client.send_document("42", self.upload(), caption="report")["ok"])
+        self.assertTrue(client.send_document("43", "stub-file-id", caption="report")["ok"])
+        upload, reuse = self.server.calls
+        self.assertEqual((upload["method"], upload["uploaded"]), ("sendDocument", True))
+        self.assertIn(b"%PDF%PDF", upload["body"])
+        self.assertEqual((reuse["method"], reuse["uploaded"]), ("sendDocument", False))
+        self.assertIn(b"document=stub-file-id", reuse["body"])
+
+    def test_send_batch_keeps_order(self):
+        chat_ids = [str(100 + i) for i in range(5)]
+        results = self.telegram_client().send_batch((chat_id, f"message {chat_id}") for chat_id in chat_ids)
+        self.assertEqual([result["result"]["chat"]["id"] for result in results], chat_ids)
+
+    def test_per_chat_rate_limit_throttles(self):
+        client = self.telegram_client(per_chat_rate=10)
+        started = time.monotonic()
+        client.send_batch([("42", "a"), ("42", "b"), ("42", "c")])
+        # One token up front, then 0.1 s per further message to the same chat
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+        started = time.monotonic()
+        client.send_batch([("1", "a"), ("2", "b"), ("3", "c")])
+        self.assertLess(time.monotonic() - started, 0.18)
+
+    def test_broadcast_uploads_once_then_reuses_file_id(self):
+        chat_ids = [str(100 + i) for i in range(6)]
+        results = self.telegram_client().broadcast(chat_ids, "report", document=self.upload())
+        self.assertEqual(set(results), set(chat_ids))
+        self.assertTrue(all(result["ok"] for result in results.values()))
+        self.assertEqual(len(self.server.calls), 6)
+        self.assertEqual(sum(call["uploaded"] for call in self.server.calls), 1)
+        self.assertTrue(all(
+            b"document=stub-file-id" in call["body"] for call in self.server.calls if not call["uploaded"]
+        ))
@@ -1,8 +1,12 @@
 from django.urls import path
-from timesheet_app.views.notification_views import NotificationListView, MarkNotificationAsReadView,DeleteReadNotificationsView
+from timesheet_app.views.notification_views import NotificationListView, MarkNotificationAsReadView,DeleteReadNotificationsView,UnreadNotificationCountView,BulkMarkNotificationsReadView
 
 urlpatterns = [
     path("notifications/", NotificationListView.as_view(), name="user-notifications"),
+    path("notifications/unread-count/", UnreadNotificationCountView.as_view(), name="unread-notification-count"),
     path("notifications/<int:pk>/mark-as-read/", MarkNotificationAsReadView.as_view(), name="mark-notification-read"),
+    path("notifications/mark-all-read/", BulkMarkNotificationsReadView.as_view(mode="all"), name="mark-all-notifications-read"),
+    path("notifications/mark-read/", BulkMarkNotificationsReadView.as_view(mode="ids"), name="mark-notifications-read"),
+    path("notifications/mark-read-before/", BulkMarkNotificationsReadView.as_view(mode="before"), name="mark-notifications-read-before"),
     path('notifications/delete-read/', DeleteReadNotificationsView.as_view(), name='delete-read-notifications'),
 ]
\ No newline at end of file
@@ -1,28 +1,186 @@
 import requests
 import os
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from django.core.cache import cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def send_telegram_message(chat_id, message, file=None):
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not bot_token:
-        raise ValueError("TELEGRAM_BOT_TOKEN is not set in .env file")
+class TokenBucket:
+    # Blocking token bucket: `rate` tokens per second, bursts up to `capacity`
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token and returns how long the caller must wait for it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+# Long-lived Bot API client: keep-alive connection pool, explicit timeouts
+# and Telegram's rate limits (~30 msg/s overall, 1 msg/s per chat)
+class TelegramClient:
+    MAX_TRACKED_CHATS = 10000
+
+    def __init__(self, bot_token, api_url="https://api.telegram.org", connect_timeout=3.05,
+                 read_timeout=15, global_rate=30, per_chat_rate=1, pool_size=10):
+        self.base_url = f"{api_url.rstrip('/')}/bot{bot_token}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.chat_buckets = OrderedDict()
+        self.chat_lock = threading.Lock()
+
+    def chat_bucket(self, chat_id):
+        with self.chat_lock:
+            bucket = self.chat_buckets.pop(str(chat_id), None)
+            if bucket is None:
+                bucket = TokenBucket(self.per_chat_rate, 1)
+            self.chat_buckets[str(chat_id)] = bucket
+            if len(self.chat_buckets) > self.MAX_TRACKED_CHATS:
+                self.chat_buckets.popitem(last=False)
+            return bucket
+
+    def call(self, method, chat_id, data, files=None):
+        self.chat_bucket(chat_id).acquire()
+        self.global_bucket.acquire()
+        response = self.session.post(f"{self.base_url}/{method}", data=data, files=files, timeout=self.timeout)
+        return response.json()
+
+    def send_message(self, chat_id, text, parse_mode="HTML"):
+        return self.call("sendMessage", chat_id, {"chat_id": chat_id, "text": text, "parse_mode": parse_mode})
+
+    def send_document(self, chat_id, document, caption="", parse_mode="HTML"):
+        # `document` is an uploaded file or the file_id of an earlier upload
+        data = {"chat_id": chat_id, "caption": caption, "parse_mode": parse_mode}
+        if isinstance(document, str):
+            data["document"] = document
+            return self.call("sendDocument", chat_id, data)
+        files = {"document": (document.name, document, document.content_type)}  # Send file directly
+        return self.call("sendDocument", chat_id, data, files=files)
+
+    def send_batch(self, messages):
+        # messages: iterable of (chat_id, text); results come back in the same order
+        return [self.safe_call(self.send_message, chat_id, text) for chat_id, text in messages]
+
+    def safe_call(self, send, chat_id, *args, **kwargs):
+        try:
+            return send(chat_id, *args, **kwargs)
+        except requests.RequestException as e:
+            return {"ok": False, "description": str(e)}
+
+    def broadcast(self, chat_ids, text, document=None, max_workers=8):
+        # Same message (and optional file) to many chats. The file body is
+        # uploaded once; later sends reuse the file_id Telegram returns.
+        # Returns {chat_id: result}.
+        chat_ids = list(dict.fromkeys(chat_ids))
+        results = {}
+        # Upload to one recipient at a time until Telegram hands back a file_id
+        while chat_ids and document is not None and not isinstance(document, str):
+            chat_id = chat_ids.pop(0)
+            document.seek(0)
+            results[chat_id] = self.safe_call(self.send_document, chat_id, document, caption=text)
+            document = uploaded_file_id(results[chat_id]) or document
 
+        def send(chat_id):
+            if document is None:
+                return self.safe_call(self.send_message, chat_id, text)
+            return self.safe_call(self.send_document, chat_id, document, caption=text)
+
+        # Rate limits are enforced by the shared token buckets, so the pool only bounds concurrency
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results.update(zip(chat_ids, pool.map(send, chat_ids)))
+        return results
+
+
+def uploaded_file_id(result):
+    # sendDocument may come back as a document, or as animation/video/audio for some types
+    message = result.get("result") if isinstance(result, dict) and result.get("ok") else None
+    for kind in ("document", "animation", "video", "audio"):
+        if message and isinstance(message.get(kind), dict) and message[kind].get("file_id"):
+            return message[kind]["file_id"]
+    return None
+
+
+_telegram_client = None
+_telegram_client_lock = threading.Lock()
+
+def get_telegram_client():
+    global _telegram_client
+    if _telegram_client is None:
+        with _telegram_client_lock:
+            if _telegram_client is None:
+                bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+                if not bot_token:
+                    raise ValueError("TELEGRAM_BOT_TOKEN is not set in .env file")
+                _telegram_client = TelegramClient(
+                    bot_token,
+                    api_url=os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"),
+                )
+    return _telegram_client
+
+def broadcast_telegram_message(chat_ids, message, file=None):
+    return get_telegram_client().broadcast(chat_ids, message, document=file)
+
+def send_telegram_message(chat_id, message, file=None):
+    client = get_telegram_client()
     if file:
         # Send a file with the message
-        url = f"https://api.telegram.org/bot{bot_token}/sendDocument"
-        files = {"document": (file.name, file, file.content_type)}  # Send file directly
-        data = {"chat_id": chat_id, "caption": message, "parse_mode": "HTML"}
-        response = requests.post(url, data=data, files=files)
-    else:
-        # Send a text message
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        payload = {
-            'chat_id': chat_id,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        response = requests.post(url, data=payload)
-
-    return response.json()
+        return client.send_document(chat_id, file, caption=message)
+    # Send a text message
+    return client.send_message(chat_id, message)
+
+# Cache generations for rollup-backed reports. Each month has its own token
+# plus a global one for open-ended ranges; changing a month's timesheets
+# rotates both, so only cached ranges covering that month go stale.
+ROLLUP_GENERATION_MAX_MONTHS = 24
+
+def _rollup_generation_keys(start, end):
+    if not start or not end or start > end:
+        return ["rollup_gen:all"]
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    if months > ROLLUP_GENERATION_MAX_MONTHS:
+        return ["rollup_gen:all"]
+    keys = []
+    year, month = start.year, start.month
+    for _ in range(months):
+        keys.append(f"rollup_gen:{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+def rollup_generation(start=None, end=None):
+    keys = _rollup_generation_keys(start, end)
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, uuid.uuid4().hex, None)
+            generations[key] = cache.get(key)
+    token = "|".join(str(generations[key]) for key in keys)
+    return hashlib.md5(token.encode()).hexdigest()
+
+def bump_rollup_generations(dates):
+    keys = {"rollup_gen:all"} | {f"rollup_gen:{day:%Y-%m}" for day in dates}
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
@@ -40,4 +40,6 @@ from .notification_views import (
     NotificationListView,
     MarkNotificationAsReadView,
     DeleteReadNotificationsView,
+    UnreadNotificationCountView,
+    BulkMarkNotificationsReadView,
 )
\ No newline at end of file
@@ -11,9 +11,10 @@ from datetime import timedelta
 from django.utils.timezone import localtime
 import random
 
-from timesheet_app.models import CustomUser, Notification
-from timesheet_app.utils import send_telegram_message
-from timesheet_app.authentication import CookieJWTAuthentication
+from django.db import transaction
+from timesheet_app.models import CustomUser
+from timesheet_app.outbox import queue_notification, queue_telegram
+from timesheet_app.authentication import CookieJWTAuthentication, add_user_claims
 
 
 # --------------------- LOGIN ---------------------
@@ -44,7 +45,7 @@ class CustomTokenObtainPairView(APIView):
 
     def generate_token_response(self, user):
         refresh = RefreshToken.for_user(user)
-        access = refresh.access_token
+        access = add_user_claims(refresh.access_token, user)
         access.set_exp(lifetime=timedelta(minutes=60))
 
         # Convert to IST
@@ -88,7 +89,11 @@ class RefreshTokenView(APIView):
         try:
             refresh_token = request.COOKIES.get("refresh_token")
             refresh = RefreshToken(refresh_token)
-            access = refresh.access_token
+            # Claims come from the current row so role/team changes show up on refresh
+            user = CustomUser.objects.get(id=refresh["user_id"])
+            if not user.is_active:
+                return Response({"error": "User is inactive"}, status=401)
+            access = add_user_claims(refresh.access_token, user)
             access.set_exp(lifetime=timedelta(minutes=60))
 
             # Convert to IST
@@ -159,7 +164,7 @@ class RequestPasswordResetCodeView(APIView):
         cache.set(f"reset_code_{user.id}", code, timeout=600)
 
         message = f"Your password reset verification code is: {code}"
-        send_telegram_message(user.chat_id, message)
+        queue_telegram(user.chat_id, message)
 
         return Response({"code": code, "message": "Verification code sent", "status": "success"}, status=status.HTTP_200_OK)
 
@@ -170,7 +175,9 @@ class ChangePasswordView(APIView):
 
     def post(self, request):
         if request.user.is_authenticated:
-            user = request.user
+            # The full row, not the token-built request.user, so save() writes
+            # current values and the CustomUser post_save receivers run
+            user = CustomUser.objects.get(pk=request.user.pk)
             current_password = request.data.get("current_password")
             new_password = request.data.get("new_password")
             confirm_password = request.data.get("confirm_password")
@@ -180,13 +187,13 @@ class ChangePasswordView(APIView):
             if new_password != confirm_password:
                 return Response({"message": "New passwords do not match"}, status=status.HTTP_400_BAD_REQUEST)
 
-            user.set_password(new_password)
-            user.save()
-            update_session_auth_hash(request, user)
+            with transaction.atomic():
+                user.set_password(new_password)
+                user.save()
+                update_session_auth_hash(request, user)
 
-            message = "Your password has been changed successfully."
-            send_telegram_message(user.chat_id, message)
-            Notification.objects.create(user=user, message=message)
+                message = "Your password has been changed successfully."
+                queue_notification(user, message)
 
             return Response({"message": "Password changed successfully", "status": "success"}, status=status.HTTP_200_OK)
 
@@ -209,13 +216,13 @@ class ChangePasswordView(APIView):
         if new_password != confirm_password:
             return Response({"message": "New passwords do not match"}, status=status.HTTP_400_BAD_REQUEST)
 
-        user.set_password(new_password)
-        user.save()
-        cache.delete(f"reset_code_{user.id}")
+        with transaction.atomic():
+            user.set_password(new_password)
+            user.save()
+            cache.delete(f"reset_code_{user.id}")
 
-        message = "Your password has been successfully reset."
-        send_telegram_message(user.chat_id, message)
-        Notification.objects.create(user=user, message=message)
+            message = "Your password has been successfully reset."
+            queue_notification(user, message)
 
         return Response({"message": "Password reset successfully", "status": "success"}, status=status.HTTP_200_OK)
 
@@ -252,21 +259,21 @@ class RegisterUserView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user = CustomUser.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                usertype=usertype,
-                firstname=firstname,
-                lastname=lastname,
-                team=team,
-                subteam=subteam,
-                chat_id=chat_id
-            )
-
-            message = f"Welcome to the Timesheet App! Your username is {username}, and your password is {password}. Please change it after login."
-            send_telegram_message(chat_id, message)
-            Notification.objects.create(user=user, message=message)
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    username=username,
+                    email=email,
+                    password=password,
+                    usertype=usertype,
+                    firstname=firstname,
+                    lastname=lastname,
+                    team=team,
+                    subteam=subteam,
+                    chat_id=chat_id
+                )
+
+                message = f"Welcome to the Timesheet App! Your username is {username}, and your password is {password}. Please change it after login."
+                queue_notification(user, message)
 
             return Response({
                 "message": "User registered successfully",
@@ -1,9 +1,10 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from timesheet_app.models import CustomUser, Notification
-from timesheet_app.utils import send_telegram_message
-from timesheet_app.notification_ws import send_notification_to_user
+from django.db import transaction
+from timesheet_app.models import CustomUser
+from timesheet_app.outbox import queue_notifications
+from timesheet_app.utils import broadcast_telegram_message
 import json
 
 # --------------------- TELEGRAM MESSAGES ---------------------
@@ -42,26 +43,27 @@ class CustomMessageView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         full_message = f"<b>From {sender.get_full_name() or sender.username}:</b>\n{original_message}"
-        failed_users = []
+        failed_users = [user.username for user in users if not user.chat_id]
+        recipients = [user for user in users if user.chat_id]
 
-        for user in users:
-            try:
-                chat_id = user.chat_id
-                if not chat_id:
-                    failed_users.append(user.username)
-                    continue
-
-                send_telegram_message(chat_id, full_message, file)
+        # One upload for the attachment, then concurrent sends reusing its file_id
+        try:
+            results = broadcast_telegram_message([user.chat_id for user in recipients], full_message, file)
+        except Exception:
+            results = {}
 
-                notification = Notification.objects.create(
-                    user=user,
-                    message=full_message
-                )
-                send_notification_to_user(notification)
-
-            except Exception:
+        delivered = []
+        for user in recipients:
+            result = results.get(user.chat_id)
+            if isinstance(result, dict) and result.get("ok"):
+                delivered.append(user)
+            else:
                 failed_users.append(user.username)
 
+        # In-app copies only; Telegram already has the message
+        with transaction.atomic():
+            queue_notifications((user.id, "", full_message) for user in delivered)
+
         if failed_users:
             return Response({
                 "message": "Message sent partially",
@@ -1,41 +1,132 @@
 # timesheet_app/views.py
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import Notification
+from timesheet_app.models import CustomUser, Notification
 from timesheet_app.serializers import NotificationSerializer
 from rest_framework.response import Response
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from timesheet_app.notification_ws import send_read_state
+from timesheet_app.pagination import encode_cursor, decode_cursor, parse_page_size
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def unread_count(user):
+    # Maintained counter column, read fresh rather than from the request's user
+    return CustomUser.objects.filter(id=user.id).values_list('unread_notification_count', flat=True).first() or 0
+
 
 # --------------------- Fetch Notifications ---------------------
 class NotificationListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-        serializer = NotificationSerializer(notifications, many=True)
-        return Response(serializer.data)
+        notifications = Notification.objects.filter(user=request.user)
+
+        cursor = request.query_params.get('cursor')
+        page_size = request.query_params.get('page_size')
+        if cursor is None and page_size is None:
+            serializer = NotificationSerializer(notifications.order_by('-created_at'), many=True)
+            return Response(serializer.data)
+
+        try:
+            page_size = parse_page_size(page_size)
+            before_id = int(decode_cursor(cursor)["id"]) if cursor else None
+        except (KeyError, TypeError, ValueError):
+            return Response({"error": "Invalid cursor or page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Newest first; ids follow creation order so the user_id index serves the keyset
+        notifications = notifications.order_by('-id')
+        if before_id is not None:
+            notifications = notifications.filter(id__lt=before_id)
+        page = list(notifications[:page_size + 1])
+
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = encode_cursor({"id": page[-1].id})
+
+        return Response({
+            "results": NotificationSerializer(page, many=True).data,
+            "next_cursor": next_cursor,
+            "unread_count": unread_count(request.user),
+        })
+
+# --------------------- Unread Notifications Count ---------------------
+class UnreadNotificationCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread_count": unread_count(request.user)})
     
 # --------------------- Mark Read  Notifications ---------------------
 class MarkNotificationAsReadView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def patch(self, request, pk):
-        try:
-            notification = Notification.objects.get(pk=pk, user=request.user)
-            notification.is_read = True
-            notification.save()
-            return Response({"message": "Marked as read"})
-        except Notification.DoesNotExist:
-            return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+        notifications = Notification.objects.filter(pk=pk, user=request.user)
+        with transaction.atomic():
+            updated = notifications.filter(is_read=False).update(is_read=True)
+            if not updated and not notifications.exists():
+                return Response({"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND)
+            if updated:
+                Notification.adjust_unread_counts({request.user.id: -updated})
+                publish_read_state(request.user, {"ids": [pk]})
+        return Response({"message": "Marked as read"})
+
+# --------------------- Bulk Mark Read Notifications ---------------------
+class BulkMarkNotificationsReadView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    mode = "all"  # "all", "ids" or "before", set per URL
+
+    def patch(self, request):
+        notifications = Notification.objects.filter(user=request.user, is_read=False)
+        scope = {"all": True}
+
+        if self.mode == "ids":
+            ids = request.data.get("ids", [])
+            if not isinstance(ids, list) or not ids or not all(str(i).isdigit() for i in ids):
+                return Response({"error": "Provide a list of notification ids under 'ids'."}, status=status.HTTP_400_BAD_REQUEST)
+            notifications = notifications.filter(id__in=ids)
+            scope = {"ids": [int(i) for i in ids]}
+        elif self.mode == "before":
+            before = parse_datetime(str(request.data.get("before", "")))
+            if not before:
+                return Response({"error": "Provide an ISO 8601 timestamp under 'before'."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+            notifications = notifications.filter(created_at__lt=before)
+            scope = {"before": before.isoformat()}
+
+        with transaction.atomic():
+            updated = notifications.update(is_read=True)
+            if updated:
+                Notification.adjust_unread_counts({request.user.id: -updated})
+                publish_read_state(request.user, scope)
+
+        return Response({"message": f"{updated} notifications marked as read.", "updated": updated})
   
 # --------------------- Delete Read Notifications ---------------------      
 class DeleteReadNotificationsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request):
-        read_notifications = Notification.objects.filter(user=request.user, is_read=True)
-        count = read_notifications.count()
-        read_notifications.delete()
+        _, deleted = Notification.objects.filter(user=request.user, is_read=True).delete()
+        count = deleted.get(Notification._meta.label, 0)
         return Response(
             {"message": f"{count} read notifications deleted."},
             status=status.HTTP_200_OK
         )
+
+
+def publish_read_state(user, scope):
+    # One event per request so other open tabs can update their badge
+    def push():
+        try:
+            send_read_state(user.id, {**scope, "unread_count": unread_count(user)})
+        except Exception:
+            logger.exception("Read-state push failed for user %s", user.id)
+    transaction.on_commit(push)
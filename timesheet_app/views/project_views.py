@@ -1,9 +1,9 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import Project,CustomUser, Team,Notification
+from timesheet_app.models import Project,CustomUser, Team
 from rest_framework.response import Response
-from timesheet_app.utils import send_telegram_message
-from timesheet_app.notification_ws import send_notification_to_user
+from timesheet_app.outbox import notify_many
+from django.db import transaction
 
 # --------------------- CREATE PROJECT ---------------------
 class CreateProjectView(APIView):
@@ -199,12 +199,15 @@ class EditProjectView(APIView):
 class DeleteProjectView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def delete(self, request, project_id, *args, **kwargs):
         try:
             user = request.user
             project = Project.objects.get(id=project_id)
             users_to_notify = set()
-            teams = project.teams.all()
+            teams = project.teams.select_related(
+                "team_leader_search", "team_leader_development", "team_leader_creative"
+            ).prefetch_related("members", "account_managers")
     
             for team in teams:
                 members = team.members.all()
@@ -220,11 +223,8 @@ class DeleteProjectView(APIView):
                     if role_user:
                         users_to_notify.add(role_user)
 
-            for user in users_to_notify:
-                message = f"The project <b>{project.name}</b> has been deleted. You have been removed from this project."
-                send_telegram_message(user.chat_id, message)
-                notification  = Notification.objects.create(user=user, message=message)
-                send_notification_to_user(notification)
+            message = f"The project <b>{project.name}</b> has been deleted. You have been removed from this project."
+            notify_many(users_to_notify, message, group=f"project_{project.id}")
                 
             project.delete()
             return Response(
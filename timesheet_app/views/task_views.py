@@ -1,9 +1,9 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import CustomUser, Task, Project,Notification
+from timesheet_app.models import CustomUser, Task, Project
 from rest_framework.response import Response
-from timesheet_app.utils import send_telegram_message
-from timesheet_app.notification_ws import send_notification_to_user
+from timesheet_app.outbox import queue_notification
+from django.db import transaction
 from django.db.models import Q
 import logging
 logger  = logging.getLogger(__name__)
@@ -13,6 +13,7 @@ logger  = logging.getLogger(__name__)
 class CreateTaskView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         data = request.data
         title = data.get('title')
@@ -114,9 +115,7 @@ class CreateTaskView(APIView):
                     f"📅 <b>Deadline:</b> {task.end_date}\n"
                     f"👤 <b>Assigned By:</b> {created_by.username}"
                 )
-                send_telegram_message(assigned_to.chat_id, message)
-                notification = Notification.objects.create(user=assigned_to, message=message)
-                send_notification_to_user(notification)
+                queue_notification(assigned_to, message)
 
             return Response(
                 {"message": "Task created successfully", "task_id": task.id},
@@ -187,6 +186,7 @@ class FetchTasksView(APIView):
 class EditTaskView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def put(self, request, task_id, *args, **kwargs):
         data = request.data
         try:
@@ -260,9 +260,7 @@ class EditTaskView(APIView):
                         f"📅 <b>Project:</b> {task.project.name}\n\n"
                         f"You have been unassigned from this task."
                     )
-                    send_telegram_message(old_assigned_to.chat_id, message_old)
-                    notification = Notification.objects.create(user=old_assigned_to, message=message_old)
-                    send_notification_to_user(notification)
+                    queue_notification(old_assigned_to, message_old)
 
             if new_assigned_to and old_assigned_to != new_assigned_to:
                 if new_assigned_to.chat_id:
@@ -273,9 +271,7 @@ class EditTaskView(APIView):
                         f"🔄 <b>Assigned By:</b> {request.user.username}\n\n"
                         f"Please check your task list for details."
                     )
-                    send_telegram_message(new_assigned_to.chat_id, message_new)
-                    notification = Notification.objects.create(user=new_assigned_to, message=message_new)
-                    send_notification_to_user(notification)
+                    queue_notification(new_assigned_to, message_new)
 
             return Response(
                 {
@@ -303,6 +299,7 @@ class EditTaskView(APIView):
 class DeleteTaskView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def delete(self, request, task_id, *args, **kwargs):
         try:
             task = Task.objects.get(id=task_id)
@@ -319,9 +316,7 @@ class DeleteTaskView(APIView):
                     f"📅 <b>Project:</b> {task.project.name}\n\n"
                     f"Please contact {request.user.username} for further details."
                 )
-                send_telegram_message(assigned_user.chat_id, message)  
-                notification = Notification.objects.create(user=assigned_user, message=message)
-                send_notification_to_user(notification)
+                queue_notification(assigned_user, message)
 
             task.delete()
             return Response(
@@ -344,6 +339,7 @@ class DeleteTaskView(APIView):
 class AssignTaskView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, task_id, *args, **kwargs):
         try:
             task = Task.objects.get(id=task_id)
@@ -386,9 +382,7 @@ class AssignTaskView(APIView):
                         f"📅 <b>Project:</b> {task.project.name}\n\n"
                         f"You have been unassigned from this task."
                     )
-                    send_telegram_message(old_assigned_to.chat_id, message_old)
-                    notification = Notification.objects.create(user=old_assigned_to, message=message_old)
-                    send_notification_to_user(notification)
+                    queue_notification(old_assigned_to, message_old)
 
             if assigned_to and old_assigned_to != assigned_to:
                 if assigned_to.chat_id:
@@ -401,9 +395,7 @@ class AssignTaskView(APIView):
                         f"📅 <b>Deadline:</b> <span style='color:red;'>{task.end_date}</span>\n"
                         f"👤 <b>Assigned By:</b> {assigned_by_text}"
                     )
-                    send_telegram_message(assigned_to.chat_id, message_new)
-                    notification = Notification.objects.create(user=assigned_to, message=message_new)
-                    send_notification_to_user(notification)
+                    queue_notification(assigned_to, message_new)
 
             return Response(
                 {"message": "Task assigned successfully", "status": "success"},
@@ -1,11 +1,12 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import CustomUser, Team, Project,Notification
+from timesheet_app.models import CustomUser, Team, Project
 from rest_framework.response import Response
-from timesheet_app.utils import send_telegram_message
+from timesheet_app.outbox import notify_many
+from timesheet_app.notification_ws import drop_broadcast_groups
+from django.db import transaction
 from django.db.models import Q
 from collections import defaultdict
-from timesheet_app.notification_ws import send_notification_to_user
 
 
 
@@ -13,6 +14,7 @@ from timesheet_app.notification_ws import send_notification_to_user
 class CreateTeamView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, *args, **kwargs):
         data = request.data
         name = data.get('name')
@@ -69,13 +71,10 @@ class CreateTeamView(APIView):
                 users_to_notify.add(team_leader_development)
             if team_leader_creative:
                 users_to_notify.add(team_leader_creative)
-                
+
             users_to_notify.discard(created_by)
-            for user in users_to_notify:
-                message = f"You have been added to the project: <b>{project.name}</b> as part of team <b>{team_instance.name}</b>."
-                send_telegram_message(user.chat_id, message)
-                notification = Notification.objects.create(user=user, message=message)
-                send_notification_to_user(notification)
+            message = f"You have been added to the project: <b>{project.name}</b> as part of team <b>{team_instance.name}</b>."
+            notify_many(users_to_notify, message, group=f"team_{team_instance.id}")
 
             return Response({"message": "Team created successfully", "status": "success"}, status=status.HTTP_201_CREATED)
 
@@ -229,6 +228,7 @@ class GetAssignedTeamView(APIView):
 class EditTeamView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def put(self, request, team_id, *args, **kwargs):
         data = request.data
         try:
@@ -332,17 +332,22 @@ class EditTeamView(APIView):
 
                 users_to_notify = new_members.union(new_ams).union(new_tls)
 
+            # After commit, sockets of anyone no longer in the team or its old
+            # project leave those groups
+            old_tls = set(filter(None, old_team_leaders.values()))
+            drop_broadcast_groups(
+                (user.id for user in old_members | old_account_managers | old_tls),
+                [f"team_{team.id}"] + [f"project_{project.id}" for project in old_projects],
+            )
+
             users_to_notify.discard(request.user)
             
 
-            for user in users_to_notify:
-                if new_project:
-                    message = f"You have been assigned to the project: <b>{new_project.name}</b> in team <b>{team.name}</b>."
-                else:
-                    message = f"You have been assigned to team <b>{team.name}</b>."
-                send_telegram_message(user.chat_id, message)
-                notification = Notification.objects.create(user=user, message=message)
-                send_notification_to_user(notification)
+            if new_project:
+                message = f"You have been assigned to the project: <b>{new_project.name}</b> in team <b>{team.name}</b>."
+            else:
+                message = f"You have been assigned to team <b>{team.name}</b>."
+            notify_many(users_to_notify, message, group=f"team_{team.id}")
 
             return Response({"message": "Team updated successfully", "status": "success"}, status=status.HTTP_200_OK)
 
@@ -358,6 +363,7 @@ class EditTeamView(APIView):
 class DeleteTeamView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def delete(self, request, team_id, *args, **kwargs):
         try:
     
@@ -372,17 +378,16 @@ class DeleteTeamView(APIView):
             if team.team_leader_creative:
                 users_to_notify.append(team.team_leader_creative)
 
-            # Notify users if the team is associated with any projects
-            if projects_assigned.exists():
-                for project in projects_assigned:
-                    for user in users_to_notify:
-                        try:
-                            message = f"The team <b>{team.name}</b> has been deleted. You have been removed from the project: <b>{project.name}</b>"
-                            send_telegram_message(user.chat_id, message)
-                            notification = Notification.objects.create(user=user, message=message)
-                            send_notification_to_user(notification)
-                        except Exception as notify_error:
-                            print(f"Failed to send notification to {user.username}: {notify_error}")
+            # Notify users if the team is associated with any projects,
+            # one message per user covering every project
+            project_names = [project.name for project in projects_assigned]
+            if project_names:
+                if len(project_names) == 1:
+                    removed_from = f"the project: <b>{project_names[0]}</b>"
+                else:
+                    removed_from = "the projects: " + ", ".join(f"<b>{name}</b>" for name in project_names)
+                message = f"The team <b>{team.name}</b> has been deleted. You have been removed from {removed_from}"
+                notify_many(users_to_notify, message, group=f"team_{team.id}")
                             
             team.projects.clear()
             # Delete the team
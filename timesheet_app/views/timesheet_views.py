@@ -1,14 +1,22 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import Timesheet,Department,TimesheetReview,Notification
-from timesheet_app.serializers import TimesheetSerializer,DepartmentSerializer
+from timesheet_app.models import Timesheet,Department,TimesheetReview,TimesheetDailyRollup
+from timesheet_app.serializers import TimesheetSerializer,DepartmentSerializer,build_rejection_feedback_map
 from rest_framework.response import Response
-from timesheet_app.utils import send_telegram_message
 from django.utils.dateparse import parse_date
 from datetime import date,datetime
-from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from timesheet_app.notification_ws import send_notification_to_user
+from timesheet_app.outbox import queue_notifications
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from timesheet_app.pagination import encode_cursor, decode_cursor, parse_page_size
+import csv
+import itertools
+import json
 
 
 
@@ -74,6 +82,8 @@ class CreateTimesheetView(APIView):
                 {"status": "error", "message": "No timesheets provided under 'timesheets' key."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        # many=True goes through TimesheetListSerializer: names are resolved
+        # once for the batch and rows are written with a single bulk insert
         serializer = TimesheetSerializer(
             data=timesheets_data,
             many=True,
@@ -110,8 +120,15 @@ class TimesheetListView(APIView):
             date_obj = date.today()
 
         # Get all timesheets for the user and date
-        timesheets = Timesheet.objects.filter(created_by=user, date=date_obj)
-        serializer = TimesheetSerializer(timesheets, many=True)
+        timesheets = list(
+            Timesheet.objects.filter(created_by=user, date=date_obj)
+            .select_related('created_by', 'project', 'department', 'submitted_to')
+        )
+        serializer = TimesheetSerializer(
+            timesheets,
+            many=True,
+            context={'rejection_feedback': build_rejection_feedback_map(timesheets)}
+        )
         return Response({
             "status": "success",
             "timesheet_table": {
@@ -133,29 +150,50 @@ class EditTimesheetView(APIView):
                 "message": "No timesheets data provided!"
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        updated_timesheets = []
-
-        for item in timesheets_data:
-            timesheet_id = item.get('id', None)
-            if timesheet_id:
-                timesheet = get_object_or_404(Timesheet, id=timesheet_id, created_by=request.user)
-                serializer = TimesheetSerializer(timesheet, data=item, partial=True, context={'request': request})
-            else:
-                serializer = TimesheetSerializer(data=item, context={'request': request})
-
-            if serializer.is_valid():
-                serializer.save()
-                updated_timesheets.append(serializer.data)
-            else:
-                return Response({
-                    "status": "error",
-                    "message": f"Error in timesheet: {serializer.errors}"
-                }, status=status.HTTP_400_BAD_REQUEST)
+        ids = {
+            str(item['id']) for item in timesheets_data
+            if isinstance(item, dict) and item.get('id')
+        }
+        try:
+            existing = {
+                str(ts.id): ts
+                for ts in Timesheet.objects.filter(id__in=ids, created_by=request.user)
+                .select_related('created_by', 'project', 'department', 'submitted_to')
+            }
+        except ValueError:
+            return Response({
+                "status": "error",
+                "message": "Invalid timesheet id."
+            }, status=status.HTTP_400_BAD_REQUEST)
 
+        missing = ids - existing.keys()
+        if missing:
+            return Response({
+                "status": "error",
+                "message": f"Timesheets not found: {', '.join(sorted(missing))}"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        # Validates every row up front, then applies one bulk update and one
+        # bulk create in a single transaction (see TimesheetListSerializer)
+        context = {'request': request}
+        serializer = TimesheetSerializer(
+            existing,
+            data=timesheets_data,
+            many=True,
+            context=context
+        )
+        if not serializer.is_valid():
+            return Response({
+                "status": "error",
+                "message": f"Error in timesheet: {serializer.errors}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer.save()
+        context['rejection_feedback'] = build_rejection_feedback_map(serializer.instance)
         return Response({
             "status": "success",
             "message": "Timesheet table updated successfully!",
-            "data": updated_timesheets
+            "data": serializer.data
         }, status=status.HTTP_200_OK)
 
 # --------------------- DELETE TIMESHEETS ---------------------
@@ -170,7 +208,11 @@ class BulkDeleteTimesheetsView(APIView):
                 "message": "No IDs provided."
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        deleted_count, _ = Timesheet.objects.filter(id__in=ids, created_by=request.user).delete()
+        timesheets = Timesheet.objects.filter(id__in=ids, created_by=request.user)
+        with transaction.atomic():
+            rollup_keys = set(timesheets.values_list('created_by_id', 'date'))
+            deleted_count, _ = timesheets.delete()
+            TimesheetDailyRollup.refresh(rollup_keys)
 
         return Response({
             "status": "success",
@@ -187,33 +229,57 @@ class SendTimesheetsForReviewView(APIView):
         if not timesheet_ids:
             return Response({"status": "error", "message": "No timesheet IDs provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        updated = []
-        notified_users = set()
+        try:
+            owned = dict(
+                Timesheet.objects.filter(id__in=timesheet_ids, created_by=request.user)
+                .values_list('id', 'submitted_to_id')
+            )
+        except ValueError:
+            return Response({"status": "error", "message": "Invalid timesheet ID."}, status=status.HTTP_400_BAD_REQUEST)
 
-        for ts_id in timesheet_ids:
-            timesheet = get_object_or_404(Timesheet, id=ts_id, created_by=request.user)
-            
-           
-            if not timesheet.submitted_to:
-                continue  
-
-            timesheet.status = "Submitted"
-            timesheet.submitted_at = timezone.now()
-            timesheet.save()
-            updated.append(ts_id)
-
-            admin = timesheet.submitted_to
-            if admin.chat_id and admin.id not in notified_users:
-                message = (
-                    f"📝 {request.user.username} submitted a timesheet for {timesheet.project.name} "
-                    f"on {timesheet.date}."
+        if len(owned) != len({str(ts_id) for ts_id in timesheet_ids}):
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        updated = [ts_id for ts_id, reviewer_id in owned.items() if reviewer_id]
+        now = timezone.now()
+
+        with transaction.atomic():
+            submitted = Timesheet.objects.filter(id__in=updated)
+            submitted.update(
+                status="Submitted",
+                submitted_at=now,
+                submission_date_group=timezone.localdate(now),
+            )
+            TimesheetDailyRollup.refresh(submitted.values_list('created_by_id', 'date').distinct())
+
+            # One row per reviewer, so each admin is notified once
+            reviewers = (
+                submitted.values('submitted_to', 'submitted_to__chat_id')
+                .annotate(
+                    first_date=Min('date'),
+                    last_date=Max('date'),
+                    project_count=Count('project', distinct=True),
+                    project_name=Min('project__name'),
                 )
-                send_telegram_message(admin.chat_id, message)
-                notification = Notification.objects.create(user=admin, message=message)
-                send_notification_to_user(notification)
-                
-                
-                notified_users.add(admin.id)
+                .order_by()
+            )
+
+            outbox_items = []
+            for reviewer in reviewers:
+                if not reviewer['submitted_to__chat_id']:
+                    continue
+                if reviewer['project_count'] == 1:
+                    project_text = reviewer['project_name']
+                else:
+                    project_text = f"{reviewer['project_count']} projects"
+                if reviewer['first_date'] == reviewer['last_date']:
+                    date_text = f"on {reviewer['first_date']}"
+                else:
+                    date_text = f"from {reviewer['first_date']} to {reviewer['last_date']}"
+                message = f"📝 {request.user.username} submitted timesheets for {project_text} {date_text}."
+                outbox_items.append((reviewer['submitted_to'], reviewer['submitted_to__chat_id'], message))
+
+            queue_notifications(outbox_items)
 
         return Response({
             "status": "success",
@@ -225,6 +291,11 @@ class SendTimesheetsForReviewView(APIView):
 class TimesheetsPendingReviewView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    ROW_FIELDS = (
+        'id', 'date', 'created_by_id', 'created_by__username', 'project__name',
+        'task', 'description', 'department__name', 'hours', 'status', 'submitted_at',
+    )
+
     def get(self, request):
         admin = request.user
 
@@ -234,32 +305,74 @@ class TimesheetsPendingReviewView(APIView):
         timesheets = Timesheet.objects.filter(
             submitted_to=admin,
             status='Submitted'
-        ).select_related('created_by', 'project').order_by('-date', 'submitted_at')
+        )
+
+        cursor = request.query_params.get('cursor')
+        page_size = request.query_params.get('page_size')
+        if cursor is None and page_size is None:
+            rows = timesheets.order_by('-date', 'submitted_at').values(*self.ROW_FIELDS)
+            return Response({"status": "success", "grouped_timesheets": self.group_rows(rows)})
 
+        try:
+            page_size = parse_page_size(page_size)
+            position = decode_cursor(cursor) if cursor else None
+            if position:
+                cursor_date = parse_date(position.get("date") or "")
+                cursor_user = int(position.get("user"))
+                if not cursor_date:
+                    raise ValueError("Invalid cursor")
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid cursor or page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Keyset pagination over (date desc, user) groups
+        groups = timesheets.values_list('date', 'created_by_id').distinct().order_by('-date', 'created_by_id')
+        if position:
+            groups = groups.filter(
+                Q(date__lt=cursor_date) | Q(date=cursor_date, created_by_id__gt=cursor_user)
+            )
+        groups = list(groups[:page_size + 1])
+
+        next_cursor = None
+        if len(groups) > page_size:
+            groups = groups[:page_size]
+            next_cursor = encode_cursor({"date": str(groups[-1][0]), "user": groups[-1][1]})
+
+        rows = []
+        if groups:
+            page_groups = set(groups)
+            rows = (
+                row for row in timesheets.filter(
+                    date__gte=groups[-1][0],
+                    date__lte=groups[0][0],
+                    created_by_id__in={user_id for _, user_id in groups},
+                ).order_by('-date', 'created_by_id', 'submitted_at').values(*self.ROW_FIELDS)
+                if (row['date'], row['created_by_id']) in page_groups
+            )
+
+        return Response({
+            "status": "success",
+            "grouped_timesheets": self.group_rows(rows),
+            "next_cursor": next_cursor,
+        })
+
+    def group_rows(self, rows):
         data = {}
-        for ts in timesheets:
-            date_str = ts.date.strftime('%Y-%m-%d')
-            username = ts.created_by.username
-
-            if date_str not in data:
-                data[date_str] = {}
-
-            if username not in data[date_str]:
-                data[date_str][username] = []
-
-            data[date_str][username].append({
-                "id": ts.id,
-                "date": ts.date.strftime('%Y-%m-%d'),
-                "project": ts.project.name,
-                "task": ts.task,
-                "description": ts.description,
-                "department": ts.department.name if ts.department else "",
-                "hours": ts.hours,
-                "status": ts.status,
-                "submitted_at": ts.submitted_at,
+        for row in rows:
+            date_str = row['date'].strftime('%Y-%m-%d')
+            username = row['created_by__username']
+
+            data.setdefault(date_str, {}).setdefault(username, []).append({
+                "id": row['id'],
+                "date": date_str,
+                "project": row['project__name'],
+                "task": row['task'],
+                "description": row['description'],
+                "department": row['department__name'] or "",
+                "hours": row['hours'],
+                "status": row['status'],
+                "submitted_at": row['submitted_at'],
             })
-
-        return Response({"status": "success", "grouped_timesheets": data})
+        return data
 
 # --------------------- ADMIN REVIEW TIMESHEETS ---------------------
 class AdminReviewTimesheetView(APIView):
@@ -273,55 +386,73 @@ class AdminReviewTimesheetView(APIView):
         if not timesheet_ids or action not in ["approve", "reject"]:
             return Response({"error": "Invalid request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Fetch timesheets
-        timesheets = Timesheet.objects.filter(id__in=timesheet_ids)
-        if not timesheets:
-            return Response({"error": "No matching timesheets found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Assume all timesheets are for same user and date
-        reviewed_user = timesheets.first().created_by
-        review_date = timesheets.first().date
-
-        # Update each timesheet
-        for ts in timesheets:
-            if action == "approve":
-                ts.status = "Approved"
-                ts.approved_at = timezone.now()
-                ts.rejected_at = None
-            else:
-                ts.status = "Rejected"
-                ts.rejected_at = timezone.now()
-                ts.approved_at = None
-            ts.save()
-
-        # Save single review record
-        TimesheetReview.objects.update_or_create(
-            reviewed_user=reviewed_user,
-            review_date=review_date,
-            defaults={
-                "reviewed_by": request.user,
-                "action": action,
-                "feedback": feedback if action == "reject" else ""
-            }
+        # Only rows waiting on this reviewer can be approved or rejected
+        timesheets = Timesheet.objects.filter(
+            id__in=timesheet_ids,
+            submitted_to=request.user,
+            status="Submitted",
         )
+        now = timezone.now()
+        if action == "approve":
+            changes = {"status": "Approved", "approved_at": now, "rejected_at": None}
+        else:
+            changes = {"status": "Rejected", "rejected_at": now, "approved_at": None}
+
+        with transaction.atomic():
+            # One (user, date) group per review record and notification
+            groups = list(
+                timesheets.values('created_by', 'created_by__username', 'created_by__chat_id', 'date')
+                .annotate(count=Count('id'))
+                .order_by('date', 'created_by__username')
+            )
+            if not groups:
+                return Response({"error": "No matching timesheets found."}, status=status.HTTP_404_NOT_FOUND)
+
+            timesheets.update(**changes)
+            TimesheetDailyRollup.refresh((group['created_by'], group['date']) for group in groups)
+
+            TimesheetReview.objects.bulk_create(
+                [
+                    TimesheetReview(
+                        reviewed_user_id=group['created_by'],
+                        review_date=group['date'],
+                        reviewed_by=request.user,
+                        action=action,
+                        feedback=feedback if action == "reject" else "",
+                    )
+                    for group in groups
+                ],
+                update_conflicts=True,
+                unique_fields=["reviewed_user", "review_date"],
+                update_fields=["reviewed_by", "action", "feedback"],
+            )
 
-        # Notify user once
-        if reviewed_user.chat_id:
-            if action == "approve":
-                msg = f"✅ Your timesheets for {review_date} have been approved by the {request.user}."
-            else:
-                msg = f"❌ Your timesheets for {review_date} were rejected by the {request.user}.\nFeedback: {feedback}"
-            send_telegram_message(reviewed_user.chat_id, msg)
-            notification  = Notification.objects.create(user=reviewed_user, message=msg)
-            send_notification_to_user(notification)
-            
-            
-
+            outbox_items = []
+            for group in groups:
+                if not group['created_by__chat_id']:
+                    continue
+                if action == "approve":
+                    msg = f"✅ Your timesheets for {group['date']} have been approved by the {request.user}."
+                else:
+                    msg = f"❌ Your timesheets for {group['date']} were rejected by the {request.user}.\nFeedback: {feedback}"
+                outbox_items.append((group['created_by'], group['created_by__chat_id'], msg))
+
+            queue_notifications(outbox_items)
+
+        reviews = [
+            {
+                "reviewed_user": group['created_by__username'],
+                "date": str(group['date']),
+                "count": group['count'],
+            }
+            for group in groups
+        ]
         return Response({
             "status": "success",
             "message": f"Timesheets {action}d successfully.",
-            "reviewed_user": reviewed_user.username,
-            "date": str(review_date),
+            "reviewed_user": reviews[0]["reviewed_user"],
+            "date": reviews[0]["date"],
+            "reviews": reviews,
         })
      
      
@@ -329,6 +460,20 @@ class AdminReviewTimesheetView(APIView):
 class ApprovedTimesheetsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    EXPORT_CHUNK_SIZE = 2000
+    EXPORT_COLUMNS = {
+        "id": "id",
+        "date": "date",
+        "user": "created_by__username",
+        "project": "project__name",
+        "task": "task",
+        "description": "description",
+        "department": "department__name",
+        "hours": "hours",
+        "submitted_to": "submitted_to__username",
+        "approved_at": "approved_at",
+    }
+
     def get(self, request):
         user = request.query_params.get('user')
         project = request.query_params.get('project')
@@ -364,9 +509,105 @@ class ApprovedTimesheetsView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+        export = request.query_params.get('export')
+        if export:
+            if export not in ('csv', 'ndjson'):
+                return Response(
+                    {"error": "Invalid export format, use csv or ndjson"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            return self.export(request, timesheets.order_by("date", "id"), export)
+
+        cursor = request.query_params.get('cursor')
+        page_size = request.query_params.get('page_size')
+        if cursor is None and page_size is None:
+            return self.full_list(timesheets)
+
+        try:
+            page_size = parse_page_size(page_size)
+            position = decode_cursor(cursor) if cursor else None
+            if position:
+                cursor_date = parse_date(position.get("date") or "")
+                cursor_id = int(position.get("id"))
+                if not cursor_date:
+                    raise ValueError("Invalid cursor")
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Invalid cursor or page_size"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Keyset pagination over (date, id)
+        timesheets = timesheets.order_by("date", "id")
+        if position:
+            timesheets = timesheets.filter(
+                Q(date__gt=cursor_date) | Q(date=cursor_date, id__gt=cursor_id)
+            )
+        page = list(
+            timesheets.select_related('created_by', 'project', 'department', 'submitted_to')[:page_size + 1]
+        )
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = encode_cursor({"date": str(page[-1].date), "id": page[-1].id})
+
+        serializer = TimesheetSerializer(
+            page,
+            many=True,
+            context={'rejection_feedback': build_rejection_feedback_map(page)}
+        )
+        return Response({
+            "results": serializer.data,
+            "next_cursor": next_cursor,
+        }, status=status.HTTP_200_OK)
+
+    def full_list(self, timesheets):
         # Order timesheets by date (ascending)
-        timesheets = timesheets.order_by("date")
+        timesheets = list(
+            timesheets.order_by("date", "id")
+            .select_related('created_by', 'project', 'department', 'submitted_to')
+        )
 
-        serializer = TimesheetSerializer(timesheets, many=True)
+        serializer = TimesheetSerializer(
+            timesheets,
+            many=True,
+            context={'rejection_feedback': build_rejection_feedback_map(timesheets)}
+        )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def export(self, request, timesheets, export_format):
+        # Streams rows straight from the cursor so large ranges never sit in memory
+        rows = timesheets.values_list(*self.EXPORT_COLUMNS.values()).iterator(chunk_size=self.EXPORT_CHUNK_SIZE)
+        header = list(self.EXPORT_COLUMNS)
+
+        if export_format == "csv":
+            writer = csv.writer(_Echo())
+            content = itertools.chain([writer.writerow(header)], (writer.writerow(row) for row in rows))
+            content_type = "text/csv"
+        else:
+            content = (
+                json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + "\n"
+                for row in rows
+            )
+            content_type = "application/x-ndjson"
+
+        if isinstance(request._request, ASGIRequest):
+            # Under ASGI a sync iterator is collected into a list before sending
+            content = _stream_chunks(content, self.EXPORT_CHUNK_SIZE)
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="approved_timesheets.{export_format}"'
+        return response
+
+
+async def _stream_chunks(lines, size):
+    # Each chunk is read on the ORM thread, one batch of lines at a time
+    next_chunk = sync_to_async(lambda: "".join(itertools.islice(lines, size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+
+class _Echo:
+    # File-like object that hands csv.writer output straight back
+    def write(self, value):
+        return value
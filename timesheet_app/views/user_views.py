@@ -1,8 +1,11 @@
 from rest_framework.views import APIView
 from rest_framework import permissions, status
-from timesheet_app.models import CustomUser,Timesheet
+from timesheet_app.models import CustomUser,Timesheet,TimesheetDailyRollup
+from timesheet_app.utils import rollup_generation
 from rest_framework.response import Response
 from django.db.models import Q,Sum
+from django.core.cache import cache
+from django.utils.dateparse import parse_date
 
 # --------------------- FETCH PROFILE INFO ---------------------
 class FetchUserDetailsView(APIView):
@@ -94,31 +97,77 @@ class FetchTeamLeadersView(APIView):
 # Fetch Working Hours Data
 class FetchWorkingHoursView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    cache_timeout = 300
 
     def get(self, request, *args, **kwargs):
         user = request.user
         usertype = user.usertype
-        user_id = user.id
+        params = request.query_params
+
+        try:
+            start = parse_date(params['from']) if params.get('from') else None
+            end = parse_date(params['to']) if params.get('to') else None
+            if (params.get('from') and not start) or (params.get('to') and not end):
+                raise ValueError
+        except ValueError:
+            return Response({"message": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+
+        project = params.get('project')
+        if project and not project.isdigit():
+            return Response({"message": "Invalid project"}, status=status.HTTP_400_BAD_REQUEST)
+
+        timesheet_status = params.get('status')
+        if timesheet_status and timesheet_status not in dict(Timesheet.STATUS_CHOICES):
+            return Response({"message": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
 
         if usertype == 'SuperAdmin' or usertype == 'Admin':
             users = CustomUser.objects.all()
+            scope = "all"
         elif usertype == 'TeamLeader':
             users = CustomUser.objects.filter(team=user.team)
+            scope = f"team:{user.team}"
         elif usertype == 'User':
             users = CustomUser.objects.filter(id=user.id)
+            scope = f"user:{user.id}"
         else:
             users = CustomUser.objects.none()
-
-        working_hours = Timesheet.objects.values('created_by__id').annotate(hours=Sum('hours'))
-        working_hours_dict = {item['created_by__id']: item['hours'] for item in working_hours}
+            scope = None
+
+        working_hours_dict = {}
+        if scope:
+            cache_key = ":".join([
+                "working_hours", scope, str(start or ""), str(end or ""),
+                project or "", timesheet_status or "", rollup_generation(start, end),
+            ])
+            working_hours_dict = cache.get(cache_key)
+            if working_hours_dict is None:
+                working_hours_dict = self.aggregate_hours(users, scope, start, end, project, timesheet_status)
+                cache.set(cache_key, working_hours_dict, self.cache_timeout)
 
         working_hours_data = [
             {"name": user.username, "hours": working_hours_dict.get(user.id, 0)}
-            for user in users
+            for user in users.only('id', 'username')
         ]
 
         return Response({"working_hours": working_hours_data}, status=status.HTTP_200_OK)
 
+    def aggregate_hours(self, users, scope, start, end, project, timesheet_status):
+        # Summed from the pre-aggregated daily rollup, limited to users in scope
+        rollups = TimesheetDailyRollup.objects.all()
+        if scope != "all":
+            rollups = rollups.filter(user__in=users)
+        if start:
+            rollups = rollups.filter(date__gte=start)
+        if end:
+            rollups = rollups.filter(date__lte=end)
+        if project:
+            rollups = rollups.filter(project_id=project)
+        if timesheet_status:
+            rollups = rollups.filter(status=timesheet_status)
+
+        working_hours = rollups.values('user_id').annotate(hours=Sum('hours')).order_by()
+        return {item['user_id']: item['hours'] for item in working_hours}
+
 # --------------------- Fetch ALL USERS FOR TELEGRAM  ---------------------
 class FetchAllUsers(APIView):
     permission_classes = [permissions.IsAuthenticated]